@@ -0,0 +1,5 @@
+"""Modules shared by the site scrapers: HTTP client, download and background caches,
+background removal backends, the image pipeline and the Parquet output
+
+Each scraper script puts the repository root on sys.path and imports from here.
+"""
@@ -0,0 +1,166 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Where background-removal outputs are cached and how much disk they may use
+CACHE_DIR = os.getenv('BG_CACHE_DIR', 'bg_cache')
+CACHE_MAX_BYTES = int(os.getenv('BG_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+INDEX_FILENAME = 'index.json'
+# Changes since the index was last written, one JSON line each; folded into the index on load and exit
+LOG_FILENAME = 'index.log'
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def make_key(image_bytes, model_version):
+    """Hash the source image bytes together with the model that processes them"""
+    digest = hashlib.sha256()
+    digest.update(model_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+
+class BackgroundCache:
+    """Size-bounded LRU cache of processed PNGs, keyed by make_key()
+
+    The index file keeps every key with its size in least-recently-used order,
+    so lookups are a dict hit and eviction pops from the front. Inserts and
+    evictions are appended to a log rather than rewriting the index, which is
+    only written out again on load and at exit.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.log_path = os.path.join(cache_dir, LOG_FILENAME)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load_index()
+        self.dirty = self._replay_log()
+        self.total_bytes = sum(self.entries.values())
+        self._save_locked()
+        self.log = open(self.log_path, 'a')
+
+        # Hits only reorder entries in memory, so persist the order on exit
+        atexit.register(self.save)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return OrderedDict((key, size) for key, size in json.load(f))
+        except (OSError, ValueError):
+            return OrderedDict()
+
+    def _replay_log(self):
+        """Apply changes logged after the index was written; returns True if there were any"""
+        try:
+            with open(self.log_path, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return False
+        for line in lines:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            if change[0] == 'put':
+                self.entries.pop(change[1], None)
+                self.entries[change[1]] = change[2]
+            else:
+                self.entries.pop(change[1], None)
+        return bool(lines)
+
+    def _log_locked(self, *change):
+        self.log.write(json.dumps(change) + '\n')
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def get(self, key):
+        """Return cached PNG bytes for key, or None on a miss"""
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.dirty = True
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            # The file was removed behind our back; forget the entry
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self._log_locked('del', key)
+                self.log.flush()
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store PNG bytes under key, evicting least recently used entries if needed"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self._log_locked('put', key, len(data))
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self._log_locked('del', old_key)
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+            self.log.flush()
+            self.dirty = True
+
+    def save(self):
+        """Write the index file if anything changed and start a new log"""
+        with self.lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if not self.dirty:
+            return
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(temp_path, self.index_path)
+        # Everything logged so far is in the index now
+        with open(self.log_path, 'w'):
+            pass
+        self.dirty = False
+
+    def print_stats(self):
+        print(f"Background cache: {self.hits} hits, {self.misses} misses, "
+              f"{len(self.entries)} images ({self.total_bytes / 1024 ** 2:.1f} MB)")
+
+
+def get_cache():
+    """Return the process-wide cache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = BackgroundCache()
+    return _cache
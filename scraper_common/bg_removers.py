@@ -0,0 +1,320 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import replicate
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+from . import bg_cache, http_client
+
+REPLICATE_MODEL = "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1"
+
+# Predictions kept queued on Replicate at once, and how often they are checked on
+REPLICATE_MAX_IN_FLIGHT = int(os.getenv('REPLICATE_MAX_IN_FLIGHT', '32'))
+REPLICATE_POLL_INTERVAL = float(os.getenv('REPLICATE_POLL_INTERVAL', '0.5'))
+
+# Checks in a row that may fail (status or output fetch) before a prediction is dropped
+REPLICATE_POLL_RETRIES = int(os.getenv('REPLICATE_POLL_RETRIES', '10'))
+
+# Most status checks sent per second. Replicate allows 3000 requests a minute
+# outside prediction creation, so with many predictions running each one is
+# checked less often rather than sending more
+REPLICATE_POLL_RATE = float(os.getenv('REPLICATE_POLL_RATE', '30'))
+
+# Backend used when a script isn't told otherwise
+DEFAULT_BACKEND = os.getenv('BG_REMOVER', 'replicate')
+
+
+def _is_throttled(error):
+    """Whether an error is a 429 from Replicate or from fetching an output"""
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429 or getattr(error, 'status', None) == 429:
+        return True
+    # Older replicate clients only keep the message: "Request was throttled..."
+    return 'throttled' in str(error).lower()
+
+
+def _image_bytes(image):
+    """Accept image bytes or a URL and return the bytes"""
+    if isinstance(image, str):
+        response = http_client.get(image)
+        response.raise_for_status()
+        return response.content
+    return image
+
+
+class BackgroundRemover:
+    """Interface shared by every background removal backend
+
+    remove() takes image bytes and returns PNG bytes with a transparent
+    background. version identifies the model and its settings, and is part of
+    the bg_cache key. host is the API host to rate limit, or None for backends
+    that run locally. concurrency is how many remove_batch() calls the image
+    pipeline makes at once.
+    """
+
+    name = None
+    version = None
+    host = None
+    batch_size = 1
+    concurrency = 4
+
+    def remove(self, image):
+        raise NotImplementedError
+
+    def remove_batch(self, images):
+        """Process several images in one call; returns PNG bytes or None for each"""
+        results = []
+        for image in images:
+            try:
+                results.append(self.remove(image))
+            except Exception as e:
+                print(f"\nError removing background with {self.name}: {e}")
+                results.append(None)
+        return results
+
+
+class ReplicateRemover(BackgroundRemover):
+    """The lucataco/remove-bg model hosted on Replicate"""
+
+    name = 'replicate'
+    host = 'api.replicate.com'
+
+    def __init__(self, model=REPLICATE_MODEL, max_in_flight=REPLICATE_MAX_IN_FLIGHT,
+                 poll_interval=REPLICATE_POLL_INTERVAL, poll_retries=REPLICATE_POLL_RETRIES,
+                 poll_rate=REPLICATE_POLL_RATE):
+        if not os.getenv('REPLICATE_API_TOKEN'):
+            raise RuntimeError("REPLICATE_API_TOKEN not found in .env file")
+        self.model = model
+        self.version = model
+        self.version_id = model.split(':')[-1]
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.poll_retries = poll_retries
+        self.poll_rate = poll_rate
+
+        # Every caller feeds one window of predictions, polled together by a
+        # single thread. The pipeline hands over one image per call, with as
+        # many calls at once as the window holds, so it never waits on a batch
+        self.concurrency = max_in_flight
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.running = {}  # prediction id -> [prediction, future, failed checks]
+        self.poller = None
+
+    def _model_input(self, image):
+        if isinstance(image, str):
+            return {"image": image}
+        # Upload straight from memory; the name tells Replicate the content type
+        upload = io.BytesIO(image)
+        upload.name = 'image.png' if image.startswith(b'\x89PNG') else 'image.jpg'
+        return {"image": upload}
+
+    def _fetch_output(self, output):
+        response = http_client.get(output)
+        response.raise_for_status()
+        return response.content
+
+    def remove(self, image):
+        output = replicate.run(self.model, input=self._model_input(image))
+        return self._fetch_output(output)
+
+    def _create(self, image):
+        """Start a prediction without waiting for it; returns None if it couldn't be created"""
+        try:
+            return replicate.predictions.create(version=self.version_id, input=self._model_input(image))
+        except Exception as e:
+            print(f"\nError creating Replicate prediction: {e}")
+            return None
+
+    def _poll(self, prediction):
+        """Refresh a prediction; returns (finished, output bytes or None)
+
+        Only a failed or canceled status finishes a prediction without output.
+        Errors reading the status or the output raise, and are retried by the
+        poller on its next round.
+        """
+        prediction.reload()
+        if prediction.status in ('starting', 'processing'):
+            return False, None
+        if prediction.status != 'succeeded':
+            print(f"\nReplicate prediction {prediction.id} {prediction.status}: {prediction.error}")
+            return True, None
+        return True, self._fetch_output(prediction.output)
+
+    def _submit(self, image):
+        """Start a prediction in the shared window; returns a future of its output"""
+        future = Future()
+        # Wait for room in the window
+        self.slots.acquire()
+        prediction = self._create(image)
+        if prediction is None:
+            self.slots.release()
+            future.set_result(None)
+            return future
+
+        with self.lock:
+            self.running[prediction.id] = [prediction, future, 0]
+            if self.poller is None:
+                self.poller = threading.Thread(target=self._poll_running, daemon=True)
+                self.poller.start()
+        return future
+
+    def _poll_running(self):
+        """Poll every running prediction until none are left, resolving each one's future
+
+        Rounds are spaced so no more than poll_rate checks go out per second,
+        and twice as far apart after a round that was throttled.
+        """
+        throttled = []
+
+        def check(entry):
+            try:
+                finished, output = self._poll(entry[0])
+            except Exception as e:
+                if _is_throttled(e):
+                    # Not the prediction's fault; it is checked again next round
+                    throttled.append(entry)
+                    return False, None
+                entry[2] += 1
+                if entry[2] < self.poll_retries:
+                    return False, None
+                print(f"\nError checking Replicate prediction {entry[0].id}: {e}")
+                return True, None
+            entry[2] = 0
+            return finished, output
+
+        delay = self.poll_interval
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            while True:
+                time.sleep(delay)
+                with self.lock:
+                    entries = list(self.running.values())
+                throttled.clear()
+                results = list(pool.map(check, entries))
+                delay = max(self.poll_interval, len(entries) / self.poll_rate if self.poll_rate else 0)
+                if throttled:
+                    delay *= 2
+                for entry, (finished, output) in zip(entries, results):
+                    if not finished:
+                        continue
+                    with self.lock:
+                        del self.running[entry[0].id]
+                    self.slots.release()
+                    entry[1].set_result(output)
+                with self.lock:
+                    if not self.running:
+                        # The next _submit() starts a new poller
+                        self.poller = None
+                        return
+
+    def remove_batch(self, images):
+        """Queue images in the shared window and wait for their outputs
+
+        Predictions from every caller share max_in_flight slots, and each slot
+        is refilled as soon as its prediction finishes, so callers running at
+        once keep the window full instead of waiting on their slowest image.
+        """
+        futures = [self._submit(image) for image in images]
+        return [future.result() for future in futures]
+
+
+class LocalMatteRemover(BackgroundRemover):
+    """CPU matte for product shots on a plain white background
+
+    Near-white pixels connected to the image border are treated as background.
+    The connectivity flood fill runs on a downscaled mask to keep it fast and is
+    then intersected with the full-resolution near-white mask.
+    """
+
+    name = 'local'
+    batch_size = 8
+
+    def __init__(self, threshold=int(os.getenv('MATTE_THRESHOLD', '235')), work_size=256, feather=1):
+        self.threshold = threshold
+        self.work_size = work_size
+        self.feather = feather
+        self.version = f"local-matte-v1:{threshold}:{work_size}:{feather}"
+
+    def remove(self, image):
+        with Image.open(io.BytesIO(_image_bytes(image))) as img:
+            rgba = img.convert('RGBA')
+
+        # 255 where every channel is near white
+        channels = [band.point(lambda v: 255 if v >= self.threshold else 0) for band in rgba.convert('RGB').split()]
+        near_white = ImageChops.multiply(ImageChops.multiply(channels[0], channels[1]), channels[2])
+
+        # Flood fill from every near-white border pixel of a small copy of the mask
+        small = near_white.copy()
+        small.thumbnail((self.work_size, self.work_size), Image.NEAREST)
+        width, height = small.size
+        border = [(x, y) for x in range(width) for y in (0, height - 1)]
+        border += [(x, y) for y in range(height) for x in (0, width - 1)]
+        for point in border:
+            if small.getpixel(point) == 255:
+                ImageDraw.floodfill(small, point, 128)
+        connected = small.point(lambda v: 255 if v == 128 else 0).resize(rgba.size, Image.BILINEAR)
+        connected = connected.point(lambda v: 255 if v >= 128 else 0)
+
+        background = ImageChops.multiply(near_white, connected)
+        alpha = ImageChops.invert(background)
+        if self.feather:
+            alpha = alpha.filter(ImageFilter.GaussianBlur(self.feather))
+        rgba.putalpha(alpha)
+
+        buffer = io.BytesIO()
+        rgba.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+
+class RembgRemover(BackgroundRemover):
+    """Local ONNX segmentation model through the optional rembg package"""
+
+    name = 'rembg'
+    batch_size = 4
+
+    def __init__(self, model_name=os.getenv('REMBG_MODEL', 'u2net')):
+        try:
+            from rembg import new_session, remove
+        except ImportError:
+            raise RuntimeError("The rembg backend needs the rembg package: pip install rembg")
+        self.session = new_session(model_name)
+        self._remove = remove
+        self.version = f"rembg:{model_name}"
+
+    def remove(self, image):
+        return self._remove(_image_bytes(image), session=self.session)
+
+
+BACKENDS = {
+    'replicate': ReplicateRemover,
+    'local': LocalMatteRemover,
+    'rembg': RembgRemover,
+}
+
+
+def get_remover(name=DEFAULT_BACKEND):
+    """Create the background remover backend called `name`"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown background remover '{name}', choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def remove_backgrounds(remover, images):
+    """Remove backgrounds from a batch of image bytes, skipping images seen before
+
+    Returns PNG bytes (or None on failure) for each image. Cache misses go to
+    the backend together in a single remove_batch() call.
+    """
+    cache = bg_cache.get_cache()
+    keys = [bg_cache.make_key(image, remover.version) for image in images]
+    results = [cache.get(key) for key in keys]
+
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        outputs = remover.remove_batch([images[i] for i in misses])
+        for i, output in zip(misses, outputs):
+            if output is not None:
+                cache.put(keys[i], output)
+                results[i] = output
+    return results
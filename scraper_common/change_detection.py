@@ -0,0 +1,108 @@
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+
+# Fields compared between runs; a product whose image field changes needs its image processed again
+TRACKED_FIELDS = ('title', 'price', 'image_url')
+IMAGE_FIELD = 'image_url'
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+UNCHANGED = 'unchanged'
+
+
+def _hash(values):
+    text = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class ChangeDetector:
+    """Compares a listing, row by row, with the snapshot saved by the previous run
+
+    Rows are reduced to a short hash of their tracked fields, so checking a
+    row is one dict lookup and a string comparison. Call check() for each
+    fetched row, then finish() to write the delta file and the new snapshot.
+    """
+
+    def __init__(self, folder, name='listing', fields=TRACKED_FIELDS, image_field=IMAGE_FIELD):
+        self.folder = folder
+        self.name = name
+        self.fields = fields
+        self.image_field = image_field
+        self.snapshot_path = os.path.join(folder, f".{name}_snapshot.json")
+        self.previous = self._load_snapshot()
+        self.current = {}
+        self.changes = []
+        self.counts = {ADDED: 0, CHANGED: 0, REMOVED: 0, UNCHANGED: 0}
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def check(self, key, row):
+        """Record a fetched row; returns (status, image_changed)"""
+        key = str(key)
+        values = [row.get(field) for field in self.fields]
+        row_hash = _hash(values)
+        image_hash = _hash([row.get(self.image_field)])
+        self.current[key] = [row_hash, image_hash, values]
+
+        old = self.previous.get(key)
+        if old is None:
+            status, image_changed = ADDED, True
+        elif old[0] == row_hash:
+            status, image_changed = UNCHANGED, False
+        else:
+            status, image_changed = CHANGED, old[1] != image_hash
+
+        self.counts[status] += 1
+        if status != UNCHANGED:
+            changed_fields = [field for field, old_value, new_value in zip(self.fields, old[2], values)
+                              if old_value != new_value] if old else list(self.fields)
+            self.changes.append((status, key, values, changed_fields))
+        return status, image_changed
+
+    def needs_image(self, key, row):
+        """check() a row and say whether its image has to be downloaded and processed"""
+        return self.check(key, row)[1]
+
+    def finish(self, complete=True):
+        """Write the delta file and save the new snapshot; returns the delta path or None
+
+        Pass complete=False when the listing was only partly fetched: rows that
+        weren't seen are then kept in the snapshot rather than reported removed.
+        """
+        if complete:
+            for key, old in self.previous.items():
+                if key not in self.current:
+                    self.counts[REMOVED] += 1
+                    self.changes.append((REMOVED, key, old[2], []))
+        else:
+            for key, old in self.previous.items():
+                self.current.setdefault(key, old)
+
+        delta_path = None
+        if self.changes:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            delta_path = os.path.join(self.folder, f"{self.name}_changes_{timestamp}.csv")
+            with open(delta_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['change', 'key', *self.fields, 'changed_fields'])
+                for status, key, values, changed_fields in self.changes:
+                    writer.writerow([status, key, *values, ' '.join(changed_fields)])
+
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.current, f)
+        os.replace(temp_path, self.snapshot_path)
+        return delta_path
+
+    def print_summary(self):
+        print(f"Changes since last run: {self.counts[ADDED]} added, {self.counts[CHANGED]} changed, "
+              f"{self.counts[REMOVED]} removed, {self.counts[UNCHANGED]} unchanged")
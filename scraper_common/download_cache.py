@@ -0,0 +1,186 @@
+import atexit
+import json
+import os
+import threading
+from . import http_client
+
+# Index of validators kept inside each download folder
+INDEX_FILENAME = '.download_index.json'
+# Downloads recorded since the index was last written, one JSON line each
+LOG_FILENAME = '.download_index.log'
+CHUNK_SIZE = 64 * 1024
+
+# Largest body download_bytes() will hold in memory
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class DownloadCache:
+    """Remembers ETag/Last-Modified for the files downloaded into one folder
+
+    Re-downloading a URL into the same file sends a conditional request, and a
+    304 leaves the file on disk untouched. Each download is appended to a log,
+    which is folded into the index on load and at exit.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, INDEX_FILENAME)
+        self.log_path = os.path.join(folder, LOG_FILENAME)
+        self.lock = threading.Lock()
+        self.entries = self._load_index()
+        self.dirty = self._replay_log()
+        self.log = None
+        self.downloaded = 0
+        self.not_modified = 0
+        self._save_locked()
+        atexit.register(self.save)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _replay_log(self):
+        """Apply downloads logged after the index was written; returns True if there were any"""
+        try:
+            with open(self.log_path, 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return False
+        for line in lines:
+            try:
+                name, entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            self.entries[name] = entry
+        return bool(lines)
+
+    def _conditional_headers(self, url, path):
+        """Validators for url, if the file saved from it is still intact"""
+        entry = self.entries.get(os.path.basename(path))
+        if not entry or entry['url'] != url:
+            return {}
+        try:
+            if os.path.getsize(path) != entry['length']:
+                return {}
+        except OSError:
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _request(self, url, path):
+        """Send a (conditional) GET; returns None when the saved copy is current"""
+        with self.lock:
+            headers = self._conditional_headers(url, path)
+
+        response = http_client.get(url, headers=headers, stream=True)
+        if response.status_code == 304:
+            response.close()
+            with self.lock:
+                self.not_modified += 1
+            return None
+        response.raise_for_status()
+        return response
+
+    def _record(self, url, path, response, length):
+        name = os.path.basename(path)
+        entry = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'length': length
+        }
+        with self.lock:
+            self.entries[name] = entry
+            self.downloaded += 1
+            self.dirty = True
+            # The folder exists by now, since the file was just saved into it
+            if self.log is None:
+                self.log = open(self.log_path, 'a')
+            self.log.write(json.dumps([name, entry]) + '\n')
+            self.log.flush()
+
+    def download(self, url, path):
+        """Stream url to path; returns False when the saved copy was still current"""
+        response = self._request(url, path)
+        if response is None:
+            return False
+
+        temp_path = f"{path}.part"
+        length = 0
+        with open(temp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                length += len(chunk)
+        os.replace(temp_path, path)
+
+        self._record(url, path, response, length)
+        return True
+
+    def download_bytes(self, url, path, max_bytes=MAX_IMAGE_BYTES):
+        """Return the body of url, writing it to path once if it changed"""
+        response = self._request(url, path)
+        if response is None:
+            with open(path, 'rb') as f:
+                return f.read()
+
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                response.close()
+                raise ValueError(f"{url} is larger than {max_bytes} bytes")
+        data = bytes(buffer)
+
+        temp_path = f"{path}.part"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        self._record(url, path, response, len(data))
+        return data
+
+    def save(self):
+        """Write the index file if anything changed and start a new log"""
+        with self.lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if not self.dirty:
+            return
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.index_path)
+        # Everything logged so far is in the index now
+        with open(self.log_path, 'w'):
+            pass
+        self.dirty = False
+
+
+def get_download_cache(folder):
+    """Return the cache for a download folder, shared by every thread"""
+    folder = os.path.abspath(folder)
+    with _caches_lock:
+        if folder not in _caches:
+            _caches[folder] = DownloadCache(folder)
+        return _caches[folder]
+
+
+def print_download_stats():
+    """Print how many downloads were skipped thanks to revalidation"""
+    downloaded = sum(cache.downloaded for cache in _caches.values())
+    not_modified = sum(cache.not_modified for cache in _caches.values())
+    if downloaded or not_modified:
+        print(f"Image downloads: {downloaded} transferred, {not_modified} unchanged (304)")
@@ -0,0 +1,103 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Number of hosts to keep connection pools for, and connections kept alive per host
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))
+
+# Retry with exponential backoff on rate limiting and server errors
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# (connect, read) timeout in seconds used when a caller doesn't pass one
+TIMEOUT = (10, 60)
+
+# urllib3's HTTP/2 support is still experimental, so it is opt-in
+ENABLE_HTTP2 = os.getenv('HTTP_ENABLE_HTTP2') == '1'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request"""
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = TIMEOUT
+        return super().send(request, **kwargs)
+
+
+def _enable_http2():
+    """Switch urllib3 to HTTP/2 when the installed version and h2 support it"""
+    try:
+        import urllib3.http2
+        urllib3.http2.inject_into_urllib3()
+        return True
+    except (ImportError, AttributeError):
+        print("HTTP/2 not available, using HTTP/1.1 with keep-alive")
+        return False
+
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=MAX_RETRIES):
+    """Create a session with per-host keep-alive pools and retry/backoff"""
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False  # Hand the last response back so callers can check it
+    )
+    adapter = TimeoutHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide shared session, creating it on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            if ENABLE_HTTP2:
+                _enable_http2()
+            _session = create_session()
+    return _session
+
+
+def get(url, **kwargs):
+    """GET a URL through the shared session"""
+    return get_session().get(url, **kwargs)
+
+
+def connection_stats(session=None):
+    """Return {host: (requests, new_connections)} for every pool the session holds"""
+    session = session or get_session()
+    stats = {}
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host = f"{key.key_scheme}://{key.key_host}"
+            requests_made, connections = stats.get(host, (0, 0))
+            stats[host] = (requests_made + pool.num_requests, connections + pool.num_connections)
+    return stats
+
+
+def print_connection_stats(session=None):
+    """Print how many requests reused an existing connection, per host"""
+    stats = connection_stats(session)
+    if not stats:
+        return
+    print("\nConnection reuse:")
+    for host, (requests_made, connections) in sorted(stats.items()):
+        reused = max(requests_made - connections, 0)
+        print(f"{host}: {requests_made} requests over {connections} connections ({reused} reused)")
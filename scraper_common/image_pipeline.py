@@ -0,0 +1,297 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+# Concurrency limits for the network-bound stages; backends may ask for more
+# background removals at once (see bg_removers.BackgroundRemover.concurrency)
+DOWNLOAD_CONCURRENCY = 8
+BG_REMOVAL_CONCURRENCY = 4
+
+# Worker processes for CPU-bound image work (conversion and PNG optimization)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 1)))
+
+# Image workers start while download and background-removal threads are running;
+# forking then could copy a lock one of those threads holds, so workers are
+# started fresh instead (forkserver where available, spawn elsewhere)
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Maximum number of requests per second started against a single host
+HOST_RATE_LIMIT = 10
+
+# Number of items allowed to wait between two stages. Each waiting item holds
+# its image in memory, so this also bounds memory use along with the worker counts
+QUEUE_SIZE = 16
+
+
+class HostRateLimiter:
+    """Space out requests so each host sees at most `rate` requests per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        # The event loop is single-threaded, so reserving a slot needs no lock
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class PipelineStats:
+    """Counters reported by the pipeline, printed as items complete"""
+
+    def __init__(self, total):
+        # None while the number of jobs isn't known; progress then counts jobs fed so far
+        self.counting = total is None
+        self.total = total or 0
+        self.successful_downloads = 0
+        self.failed_downloads = 0
+        self.successful_bg_removals = 0
+        self.failed_bg_removals = 0
+
+    def print_progress(self):
+        print(f"\rProcessed ({self.successful_downloads}/{self.total}) Images - "
+              f"Downloads: {self.successful_downloads}, "
+              f"Background Removals: {self.successful_bg_removals}", end='', flush=True)
+
+    def as_tuple(self):
+        return (self.successful_downloads, self.failed_downloads,
+                self.successful_bg_removals, self.failed_bg_removals)
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+async def _run_stage(process, inbox, outbox, workers, next_workers, limiter=None, host_for=None, on_done=None):
+    """Run `workers` tasks that take jobs from inbox, await process(job) and pass successes on"""
+    async def worker():
+        while True:
+            job = await inbox.get()
+            if job is None:
+                break
+            if limiter:
+                await limiter.wait(host_for(job))
+            try:
+                ok = await process(job)
+            except Exception as e:
+                print(f"\nError processing {job['url']}: {e}")
+                ok = False
+            if not ok:
+                job['data'] = None
+            if on_done:
+                on_done(job, ok)
+            if ok and outbox is not None:
+                await outbox.put(job)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    # Tell every worker of the next stage that no more jobs are coming
+    if outbox is not None:
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+
+async def _run_batch_stage(process_batch, inbox, outbox, workers, next_workers, batch_size,
+                           limiter=None, host=None, on_done=None):
+    """Like _run_stage, but each worker takes up to batch_size waiting jobs at once
+
+    process_batch(jobs) returns one ok flag per job.
+    """
+    async def worker():
+        finished = False
+        while not finished:
+            job = await inbox.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < batch_size:
+                try:
+                    job = inbox.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if job is None:
+                    # This worker's end marker: finish the batch, then stop
+                    finished = True
+                    break
+                batch.append(job)
+
+            if limiter and host:
+                await limiter.wait(host)
+            try:
+                oks = await process_batch(batch)
+            except Exception as e:
+                print(f"\nError processing batch of {len(batch)} images: {e}")
+                oks = [False] * len(batch)
+
+            for job, ok in zip(batch, oks):
+                if not ok:
+                    job['data'] = None
+                if on_done:
+                    on_done(job, ok)
+                if ok and outbox is not None:
+                    await outbox.put(job)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    if outbox is not None:
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+
+async def _run_pipeline(jobs, download, convert, remove_bg, post_process, stats, on_stage, bg_batch_size, bg_host,
+                        bg_concurrency):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=DOWNLOAD_CONCURRENCY + bg_concurrency + IMAGE_WORKERS
+    ))
+
+    limiter = HostRateLimiter(HOST_RATE_LIMIT)
+    to_download = asyncio.Queue(QUEUE_SIZE)
+    to_convert = asyncio.Queue(QUEUE_SIZE)
+    to_remove_bg = asyncio.Queue(QUEUE_SIZE)
+    to_save = asyncio.Queue(QUEUE_SIZE)
+    producer_error = []
+
+    def downloaded(job, ok):
+        if on_stage:
+            on_stage(job, 'downloaded', ok)
+        if ok:
+            stats.successful_downloads += 1
+            stats.print_progress()
+        else:
+            stats.failed_downloads += 1
+
+    def converted(job, ok):
+        if on_stage:
+            on_stage(job, 'converted', ok)
+        # A failed conversion means the background was never removed
+        if not ok:
+            stats.failed_bg_removals += 1
+
+    def bg_removed(job, ok):
+        # Successes are counted once the output has been saved
+        if not ok:
+            if on_stage:
+                on_stage(job, 'bg_removed', ok)
+            stats.failed_bg_removals += 1
+            stats.print_progress()
+
+    def saved(job, ok):
+        if on_stage:
+            on_stage(job, 'bg_removed', ok)
+        if ok:
+            stats.successful_bg_removals += 1
+        else:
+            stats.failed_bg_removals += 1
+        stats.print_progress()
+
+    with ProcessPoolExecutor(max_workers=IMAGE_WORKERS,
+                             mp_context=multiprocessing.get_context(START_METHOD)) as image_pool:
+
+        async def download_job(job):
+            job['data'] = await asyncio.to_thread(download, job['url'], job['image_path'])
+            return job['data'] is not None
+
+        async def convert_job(job):
+            if convert is not None:
+                job['data'] = await loop.run_in_executor(image_pool, convert, job['data'])
+            return job['data'] is not None
+
+        async def remove_bg_batch(batch):
+            results = await asyncio.to_thread(remove_bg, [job['data'] for job in batch])
+            for job, result in zip(batch, results):
+                job['data'] = result
+            return [result is not None for result in results]
+
+        async def save_job(job):
+            data = job['data']
+            # Release the image buffer as soon as the item is done
+            job['data'] = None
+            if post_process is not None:
+                data = await loop.run_in_executor(image_pool, post_process, data)
+                if data is None:
+                    return False
+            await asyncio.to_thread(_write_file, job['processed_path'], data)
+            return True
+
+        async def feed():
+            # jobs may be a generator that blocks on scraping, so pull from it off the loop.
+            # Only QUEUE_SIZE jobs wait at a time, however many the generator produces
+            iterator = iter(jobs)
+            while True:
+                try:
+                    job = await asyncio.to_thread(next, iterator, None)
+                except Exception as e:
+                    # Let the jobs already fed finish, then hand the error to the caller
+                    producer_error.append(e)
+                    break
+                if job is None:
+                    break
+                if stats.counting:
+                    stats.total += 1
+                await to_download.put(job)
+            for _ in range(DOWNLOAD_CONCURRENCY):
+                await to_download.put(None)
+
+        await asyncio.gather(
+            feed(),
+            _run_stage(
+                download_job, to_download, to_convert, DOWNLOAD_CONCURRENCY, IMAGE_WORKERS,
+                limiter=limiter, host_for=lambda job: urlparse(job['url']).netloc, on_done=downloaded
+            ),
+            _run_stage(
+                convert_job, to_convert, to_remove_bg, IMAGE_WORKERS, bg_concurrency,
+                on_done=converted
+            ),
+            _run_batch_stage(
+                remove_bg_batch, to_remove_bg, to_save, bg_concurrency, IMAGE_WORKERS, bg_batch_size,
+                limiter=limiter, host=bg_host, on_done=bg_removed
+            ),
+            _run_stage(
+                save_job, to_save, None, IMAGE_WORKERS, 0,
+                on_done=saved
+            ),
+        )
+
+    if producer_error:
+        raise producer_error[0]
+
+
+def run_image_pipeline(jobs, download, convert, remove_bg, post_process=None, total=None, on_stage=None,
+                       bg_batch_size=1, bg_host=None, bg_concurrency=BG_REMOVAL_CONCURRENCY):
+    """Download, convert and remove backgrounds for jobs concurrently
+
+    jobs is any iterable of dicts with 'url', 'image_path' and 'processed_path'.
+    A generator is consumed lazily, so work starts on the first job while later
+    ones are still being scraped; total defaults to len(jobs) when it has one.
+    Images stay in memory between stages: download(url, image_path) returns the
+    image bytes (saving the original once) or None, and remove_bg(list of bytes)
+    returns the processed PNG bytes or None for each, taking up to bg_batch_size
+    images per call and making up to bg_concurrency calls at once. Calls are
+    rate limited against bg_host when the backend is remote (see
+    bg_removers.BackgroundRemover.host). convert(bytes) and
+    post_process(bytes) run in a pool of IMAGE_WORKERS processes, so they must
+    be module-level functions (see image_transforms); either may be None to
+    skip that step. The result is written to 'processed_path'.
+
+    on_stage(job, stage, ok) is called on the event loop after each
+    'downloaded', 'converted' and 'bg_removed' step. Returns
+    (successful_downloads, failed_downloads, successful_bg_removals,
+    failed_bg_removals). If iterating jobs raises, the jobs already produced
+    are finished and the exception is then re-raised.
+    """
+    if total is None and hasattr(jobs, '__len__'):
+        total = len(jobs)
+    stats = PipelineStats(total)
+    asyncio.run(_run_pipeline(jobs, download, convert, remove_bg, post_process, stats, on_stage,
+                              bg_batch_size, bg_host, bg_concurrency))
+    return stats.as_tuple()
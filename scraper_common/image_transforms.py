@@ -0,0 +1,38 @@
+import io
+import os
+from PIL import Image
+
+# Longest side of the saved no_bg_*.png files; 0 keeps the model's output size
+MAX_OUTPUT_SIZE = int(os.getenv('MAX_OUTPUT_SIZE', '0'))
+
+# These functions run in worker processes, so they take and return encoded
+# image bytes (cheap to pickle) rather than decoded images
+
+
+def to_png(image_bytes):
+    """Decode image bytes and re-encode them as an RGBA PNG"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            # Convert to RGBA to ensure transparency support
+            img = img.convert('RGBA')
+            buffer = io.BytesIO()
+            img.save(buffer, 'PNG')
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"\nError converting image to PNG: {e}")
+        return None
+
+
+def optimize_png(png_bytes, max_size=MAX_OUTPUT_SIZE):
+    """Downscale a processed PNG to max_size and recompress it"""
+    try:
+        with Image.open(io.BytesIO(png_bytes)) as img:
+            img.load()
+            if max_size and max(img.size) > max_size:
+                img.thumbnail((max_size, max_size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, 'PNG', optimize=True)
+        return buffer.getvalue()
+    except Exception as e:
+        print(f"\nError optimizing processed image: {e}")
+        return None
@@ -0,0 +1,136 @@
+import os
+import re
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Parquet is written whenever pyarrow is installed; set WRITE_PARQUET=0 to skip it
+WRITE_PARQUET = os.getenv('WRITE_PARQUET', '1') != '0'
+
+# Consolidated dataset shared by every scraper in the repo, laid out as
+# source=<source>/category=<category>/date=<YYYY-MM-DD>/<run>.parquet, at the repo
+# root whichever folder a scraper is run from
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.getenv('DATASET_DIR', os.path.join(REPO_DIR, 'scrape_dataset'))
+
+# Rows buffered before they are written out as one row group
+BATCH_SIZE = 500
+
+# One schema for every source, so the whole dataset loads as a single table.
+# Partition columns (source, category, date) live in the directory names
+if pa is not None:
+    SCHEMA = pa.schema([
+        ('scraped_at', pa.timestamp('us', tz='UTC')),
+        ('rank', pa.int32()),
+        ('product_id', pa.string()),
+        ('title', pa.string()),
+        ('brand', pa.string()),
+        ('retailer', pa.string()),
+        ('price', pa.float64()),
+        ('url', pa.string()),
+        ('image_url', pa.string()),
+    ])
+    FILE_SCHEMA = SCHEMA.insert(0, pa.field('category', pa.string())).insert(0, pa.field('source', pa.string()))
+
+
+def parse_price(value):
+    """Turn 12.5, "12.50" or "$1,234.00" into a float; None if there is no price"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r'\d[\d,]*(?:\.\d+)?', str(value))
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+class ParquetOutput:
+    """Typed product rows appended to Parquet in batches
+
+    Rows go to a file next to the CSV/Excel output (with source and category
+    columns) and to this run's file in the partitioned dataset. Does nothing
+    when pyarrow isn't installed. Use it as a context manager so the files
+    are closed: the dataset file only appears once the block finishes without
+    an exception, so a listing that failed partway never looks complete there.
+    """
+
+    def __init__(self, path, source, category, dataset_dir=DATASET_DIR, batch_size=BATCH_SIZE):
+        self.enabled = pa is not None and WRITE_PARQUET
+        self.path = path
+        self.source = source
+        self.category = category
+        self.batch_size = batch_size
+        self.scraped_at = datetime.now(timezone.utc)
+        self.rows = []
+        self.writers = []
+        self.dataset_path = None
+        self.dataset_temp_path = None
+        if not self.enabled:
+            return
+
+        self.writers.append((pq.ParquetWriter(path, FILE_SCHEMA, compression='zstd'), FILE_SCHEMA))
+        if dataset_dir:
+            partition = os.path.join(
+                dataset_dir, f"source={source}", f"category={category}",
+                f"date={self.scraped_at.date().isoformat()}"
+            )
+            os.makedirs(partition, exist_ok=True)
+            name = f"{self.scraped_at.strftime('%H%M%S')}-{os.getpid()}.parquet"
+            self.dataset_path = os.path.join(partition, name)
+            # Dataset readers skip files starting with a dot, so the file is hidden until it is complete
+            self.dataset_temp_path = os.path.join(partition, f".{name}.part")
+            self.writers.append((pq.ParquetWriter(self.dataset_temp_path, SCHEMA, compression='zstd'), SCHEMA))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(complete=exc_type is None)
+
+    def append(self, row):
+        """Queue one product; keys missing from row are written as nulls"""
+        if not self.enabled:
+            return
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.enabled or not self.rows:
+            return
+        columns = {
+            'source': [self.source] * len(self.rows),
+            'category': [self.category] * len(self.rows),
+            'scraped_at': [self.scraped_at] * len(self.rows),
+            'price': [parse_price(row.get('price')) for row in self.rows],
+        }
+        columns['product_id'] = [None if row.get('product_id') in (None, '') else str(row['product_id'])
+                                 for row in self.rows]
+        for name in ('rank', 'title', 'brand', 'retailer', 'url', 'image_url'):
+            columns[name] = [row.get(name) for row in self.rows]
+        for writer, schema in self.writers:
+            writer.write_table(pa.Table.from_pydict({name: columns[name] for name in schema.names}, schema=schema))
+        self.rows = []
+
+    def close(self, complete=True):
+        """Close the files; the dataset file is kept only if complete"""
+        self.flush()
+        for writer, _ in self.writers:
+            writer.close()
+        self.writers = []
+        if self.dataset_temp_path:
+            if complete:
+                os.replace(self.dataset_temp_path, self.dataset_path)
+            else:
+                os.remove(self.dataset_temp_path)
+                self.dataset_path = None
+            self.dataset_temp_path = None
+
+
+def open_dataset(dataset_dir=DATASET_DIR):
+    """Every scrape written so far as one pyarrow dataset, partitioned by source/category/date"""
+    import pyarrow.dataset as ds
+    return ds.dataset(dataset_dir, format='parquet', partitioning='hive')
@@ -0,0 +1,90 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from product_parser import BACKENDS, extract_products
+
+SNAPSHOT_DIR = os.getenv('HTML_SNAPSHOT_DIR', 'html_snapshots')
+
+
+def run_backend(backend, paths, repeat):
+    """Parse every snapshot with one backend in this process and print the results as JSON"""
+    pages = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+
+    # Peak RSS before parsing, so the report can show what parsing added
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    counts = []
+    for _ in range(repeat):
+        counts = [len(extract_products(page, backend)) for page in pages]
+    elapsed = (time.perf_counter() - start) / repeat
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'backend': backend,
+        'seconds': elapsed,
+        'products': sum(counts),
+        'peak_rss_kb': peak,
+        'parse_rss_kb': peak - baseline,
+    }))
+
+
+def check_parity(paths):
+    """Report snapshots where the backends disagree"""
+    same = True
+    for path in paths:
+        with open(path, 'rb') as f:
+            page = f.read()
+        results = {backend: extract_products(page, backend) for backend in BACKENDS}
+        if len({json.dumps(products, sort_keys=True) for products in results.values()}) > 1:
+            same = False
+            counts = ', '.join(f"{backend}: {len(products)}" for backend, products in results.items())
+            print(f"✗ Backends disagree on {path} ({counts})")
+    if same:
+        print(f"✓ All backends agree on {len(paths)} snapshots")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTML parser backends on saved page snapshots")
+    parser.add_argument('paths', nargs='*', help=f"HTML snapshots (default: {SNAPSHOT_DIR}/*.html)")
+    parser.add_argument('--repeat', type=int, default=3, help="parse each snapshot this many times")
+    parser.add_argument('--worker', choices=list(BACKENDS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(SNAPSHOT_DIR, '*.html')))
+    if not paths:
+        print(f"No snapshots found. Run brand-scrape.py with HTML_SNAPSHOT_DIR={SNAPSHOT_DIR} to save some.")
+        return
+
+    if args.worker:
+        run_backend(args.worker, paths, args.repeat)
+        return
+
+    total_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+    print(f"Parsing {len(paths)} snapshots ({total_mb:.1f} MB), averaged over {args.repeat} runs")
+    check_parity(paths)
+
+    # Each backend runs in a fresh process so peak RSS isn't shared between them
+    for backend in BACKENDS:
+        result = subprocess.run(
+            [sys.executable, __file__, '--worker', backend, '--repeat', str(args.repeat), *paths],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{backend}: failed\n{result.stderr}")
+            continue
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{backend:>5}: {stats['seconds'] * 1000:8.1f} ms, {stats['products']} products, "
+              f"peak RSS {stats['peak_rss_kb'] / 1024:.1f} MB (+{stats['parse_rss_kb'] / 1024:.1f} MB parsing)")
+
+
+if __name__ == "__main__":
+    main()
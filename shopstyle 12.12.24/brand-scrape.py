@@ -1,17 +1,28 @@
 import os
+import sys
+import argparse
+import threading
 import requests
 import json
-import replicate
 import csv
+import time
+import itertools
 from dotenv import load_dotenv
 from urllib.parse import urlparse
-from selenium import webdriver
+from concurrent.futures import ThreadPoolExecutor
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-import time
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import bg_cache, http_client
+from driver_pool import POOL_SIZE, WebDriverPool, new_driver
+from lazy_scroll import scroll_until_stable
+from product_parser import iter_products
+from scraper_common.bg_removers import get_remover, remove_backgrounds
+from scraper_common.image_pipeline import run_image_pipeline
+from scraper_common.outputs import ParquetOutput
+from scraper_common.change_detection import ChangeDetector
 from datetime import datetime
 
 # Load environment variables
@@ -19,10 +30,14 @@ load_dotenv()
 
 # Configuration
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+if REPLICATE_API_TOKEN:
+    os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
 OUTPUT_DIR = "scraped_data"
 OUTPUT_FOLDER = "processed_images"
-SCROLL_PAUSE_TIME = 1
+# Set to a folder to keep every rendered page, e.g. for benchmark_parser.py
+SNAPSHOT_DIR = os.getenv('HTML_SNAPSHOT_DIR')
+# Brands scraped and processed at once in batch mode
+SCRAPE_WORKERS = int(os.getenv('SCRAPE_WORKERS', '4'))
 
 # Ensure output directories exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -36,179 +51,319 @@ def is_valid_url(url):
     except:
         return False
 
+def render_page(driver, url):
+    """Load a page in a browser and return its HTML once every product has loaded"""
+    driver.get(url)
+    
+    WebDriverWait(driver, 20).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "web-root"))
+    )
+    
+    # Scroll in the page itself until no new products or images appear
+    result = scroll_until_stable(driver, "web-product-cell-r", "img.product-cell__image")
+    print(f"Loaded {result['cells']} products ({result['images']} images) in {result['seconds']:.1f}s from {url}")
+    if result['timed_out']:
+        print(f"Warning: products were still loading when the scroll timed out on {url}")
+    
+    html_content = driver.page_source
+    if SNAPSHOT_DIR:
+        save_snapshot(html_content, url)
+    return html_content
+
+def save_snapshot(html_content, url):
+    """Save a rendered page so parsers can be tested against it later"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(SNAPSHOT_DIR, f"{url.rstrip('/').split('/')[-1]}_{timestamp}.html")
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
 def get_formatted_html(url):
     """Scrape HTML content with dynamic loading"""
+    driver = None
     try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        driver = webdriver.Chrome(options=chrome_options)
-        driver.get(url)
-        
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "web-root"))
-        )
-        
-        scroll_height = 0
-        max_attempts = 30
-        attempts = 0
-        
-        while attempts < max_attempts:
-            driver.execute_script(f"window.scrollTo({scroll_height}, {scroll_height + 800})")
-            scroll_height += 800
-            time.sleep(SCROLL_PAUSE_TIME)
-            
-            images = driver.find_elements(By.CSS_SELECTOR, "img.product-cell__image")
-            visible_images = [img for img in images if 
-                            driver.execute_script("return arguments[0].getBoundingClientRect().top", img) < 
-                            driver.execute_script("return window.innerHeight")]
-            
-            for img in visible_images:
-                try:
-                    WebDriverWait(driver, 5).until(
-                        lambda d: d.execute_script(
-                            "return arguments[0].complete && arguments[0].naturalHeight !== 0", img
-                        )
-                    )
-                except:
-                    continue
-            
-            current_height = driver.execute_script("return document.documentElement.scrollHeight")
-            if scroll_height >= current_height:
-                break
-                
-            attempts += 1
-        
-        html_content = driver.page_source
-        driver.quit()
-        return html_content
-        
+        driver = new_driver()
+        return render_page(driver, url)
     except Exception as e:
         print(f"Error scraping HTML: {e}")
         return None
+    finally:
+        # Never leave a Chrome process behind, whatever went wrong
+        if driver is not None:
+            driver.quit()
 
 def extract_product_info(html_content):
-    """Extract product information from HTML"""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    products = []
-    product_cells = soup.find_all('web-product-cell-r')
-    
-    for cell in product_cells:
-        product = {}
-        
-        img = cell.find('img', {'class': 'product-cell__image'})
-        if img and img.get('src', '').endswith('.jpg'):
-            product['image_url'] = img.get('src')
-        
-        brand = cell.find('span', {'class': 'ss-t-text-ellipsis ss-w-full'})
-        if brand:
-            product['brand'] = brand.text.strip()
-            
-        name = cell.find('span', {'data-test': 'product-cell__product-name'})
-        if name:
-            product['product_name'] = name.text.strip()
-            
-        price = cell.find('span', {'data-test': 'product-cell__price'})
-        if price:
-            product['price'] = price.text.strip()
-            
-        retailer = cell.find('span', {'data-test': 'product-cell__retailer-link'})
-        if retailer:
-            product['retailer'] = retailer.text.strip()
-        
-        if product:
-            products.append(product)
-    
-    return products
+    """Extract product information from HTML, yielding products as they are parsed"""
+    return iter_products(html_content)
 
-def save_to_csv(products, category):
-    """Save products to CSV file"""
+def csv_filename(category):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{OUTPUT_DIR}/{category}_{timestamp}.csv"
-    
-    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+    return f"{OUTPUT_DIR}/{category}_{timestamp}.csv"
+
+def stream_to_csv(products, filename, category, counts):
+    """Append each product to the CSV (and Parquet) as it arrives and pass it on
+
+    counts['products'] is incremented for every row written.
+    """
+    # Get the first product before creating the outputs, so a page with none leaves no empty files
+    products = iter(products)
+    first_product = next(products, None)
+    if first_product is None:
+        return
+    parquet_path = os.path.splitext(filename)[0] + '.parquet'
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile, \
+            ParquetOutput(parquet_path, 'shopstyle', category) as parquet:
         fieldnames = ['brand', 'product_name', 'price', 'retailer', 'image_url']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        for product in products:
+        for product in itertools.chain([first_product], products):
             writer.writerow(product)
-    
-    return filename
+            csvfile.flush()
+            counts['products'] += 1
+            parquet.append({
+                'rank': counts['products'],
+                'title': product.get('product_name'),
+                'brand': product.get('brand'),
+                'retailer': product.get('retailer'),
+                # "$1,234" in the CSV, 1234.0 here
+                'price': product.get('price'),
+                'image_url': product.get('image_url')
+            })
+            yield product
+
+def safe_filename(product_name):
+    return "".join(c for c in product_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
 
-def remove_background_with_replicate(image_url, product_name):
-    """Remove background from product image"""
+def download_source_image(image_url, image_path):
+    """Download a product's original image, whose bytes key the background cache"""
     try:
-        if not is_valid_url(image_url):
-            print(f"✗ Invalid URL for {product_name}")
-            return None
+        response = http_client.get(image_url)
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"\n✗ Request Error: {image_url} - {str(e)}")
+        return None
 
-        safe_name = "".join(c for c in product_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        output_path = os.path.join(OUTPUT_FOLDER, f"{safe_name}.png")
+def with_output_paths(products, output_folder):
+    """Set each product's processed_path as it passes through
 
-        output = replicate.run(
-            "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": image_url}
-        )
+    Files are named after the product, and several products can share a name,
+    so repeats are numbered in listing order (name#2.png, ...) instead of
+    overwriting each other.
+    """
+    seen = {}
+    for product in products:
+        name = safe_filename(product.get('product_name') or '')
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}#{seen[name]}"
+        product['processed_path'] = os.path.join(output_folder, f"{name}.png")
+        yield product
 
-        response = requests.get(output, stream=True)
-        response.raise_for_status()
-        
-        with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
+def image_jobs(products):
+    """Yield a pipeline job for every product with a usable image"""
+    for product in products:
+        if not product.get('product_name') or not is_valid_url(product.get('image_url', '')):
+            print(f"\n✗ Invalid URL for {product.get('product_name')}")
+            continue
+        yield {
+            'url': product['image_url'],
+            # Originals aren't kept; only the processed image is saved
+            'image_path': None,
+            'processed_path': product['processed_path']
+        }
 
-        print(f"✓ Processed: {safe_name}")
-        return output_path
+def process_products_backgrounds(products, remover, output_folder=OUTPUT_FOLDER):
+    """Process background removal for all products; returns (processed, failed) counts
 
-    except replicate.exceptions.ReplicateError as e:
-        print(f"✗ Replicate API Error: {product_name} - {str(e)}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"✗ Request Error: {product_name} - {str(e)}")
-        return None
-    except Exception as e:
-        print(f"✗ Unexpected Error: {product_name} - {str(e)}")
-        return None
+    products may be a generator: each image is downloaded and queued for the
+    backend as soon as its product arrives, with only a bounded number held
+    in memory at once.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    print("\nStarting background removal...")
 
-def process_products_backgrounds(products):
-    """Process background removal for all products"""
-    total = len(products)
-    print(f"\nStarting background removal for {total} products...")
-    
-    for i, product in enumerate(products, 1):
-        print(f"\nProcessing {i}/{total}: {product['product_name']}")
-        remove_background_with_replicate(
-            product['image_url'],
-            product['product_name']  # Removed brand prefix
-        )
+    successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals = run_image_pipeline(
+        image_jobs(products), download_source_image, None,
+        lambda images: remove_backgrounds(remover, images),
+        bg_batch_size=remover.batch_size, bg_host=remover.host, bg_concurrency=remover.concurrency
+    )
+    print()
+    return successful_bg_removals, failed_downloads + failed_bg_removals
+
+def iter_scraped_products(url, pool=None):
+    """Render a page in Chrome and yield its products as they are parsed"""
+    if pool is not None:
+        html_content = pool.run(render_page, url)
+    else:
+        html_content = get_formatted_html(url)
+    if not html_content:
+        print(f"Failed to get HTML content for {url}")
+        return
+    yield from extract_product_info(html_content)
+
+def product_key(product):
+    """Products parsed from the page have no ids, so brand|name|retailer identifies them"""
+    return "|".join(product.get(field) or '' for field in ('brand', 'product_name', 'retailer'))
+
+def changed_products(products, detector):
+    """Pass on only the products that are new or whose image changed since the last run"""
+    seen = {}
+    for product in products:
+        # Parsed pages have no ids, and variants can share brand, name and retailer;
+        # number repeats in listing order so they don't overwrite each other
+        key = product_key(product)
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}#{seen[key]}"
+        if detector.needs_image(key, {
+            'title': product.get('product_name'), 'price': product.get('price'), 'image_url': product.get('image_url')
+        }) or not os.path.exists(product['processed_path']):
+            yield product
+
+def scrape_and_process(url, category, remover, pool=None, output_folder=OUTPUT_FOLDER, incremental=False,
+                       counts=None):
+    """Scrape a page and remove backgrounds as its products arrive
+
+    Each product is written to the CSV and handed to the image pipeline as
+    soon as it is scraped, so the first images are processed within seconds.
+    With incremental, the listing is compared with the previous run's: the
+    changes are saved to a delta CSV and only new or changed images are
+    processed. Returns the CSV path and the product, processed and failed counts.
+    counts['products'] counts the rows written so far, even if a later page fails.
+    """
+    filename = csv_filename(category)
+    if counts is None:
+        counts = {'products': 0}
+    products = stream_to_csv(iter_scraped_products(url, pool), filename, category, counts)
+    products = with_output_paths(products, output_folder)
+    detector = ChangeDetector(OUTPUT_DIR, category) if incremental else None
+    if detector:
+        products = changed_products(products, detector)
+    processed, failed = process_products_backgrounds(products, remover, output_folder)
+    # Reached only when every page arrived; a failed page raises out of the pipeline above
+    if detector and counts['products']:
+        delta_path = detector.finish()
+        detector.print_summary()
+        if delta_path:
+            print(f"Changes saved to {delta_path}")
+    return filename, counts['products'], processed, failed
+
+def brand_label(url):
+    """Name for a browse URL's files, e.g. men_gucci for /browse/men/gucci"""
+    parts = [part for part in urlparse(url).path.split('/') if part and part != 'browse']
+    return "_".join(parts) or "shopstyle"
+
+def read_url_file(path):
+    """Read one URL per line, skipping blank lines and # comments"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+def run_batch(urls, remover, incremental=False):
+    """Scrape and process many brands at once
+
+    SCRAPE_WORKERS brands run at a time, each pipelined from scraping through
+    background removal, and they share one WebDriverPool for pages that need
+    a browser. This is the pool's batch API: brands are rendered concurrently
+    across its browsers. Returns the per-brand progress.
+    """
+    progress = {url: {'brand': brand_label(url), 'status': 'queued', 'products': 0,
+                      'processed': 0, 'failed': 0, 'csv': None, 'seconds': 0.0}
+                for url in urls}
+    lock = threading.Lock()
+
+    def update(url, **changes):
+        with lock:
+            progress[url].update(changes)
+            finished = sum(brand['status'] in ('done', 'failed') for brand in progress.values())
+            print(f"\n[{finished}/{len(urls)}] {progress[url]['brand']}: {progress[url]['status']}")
+
+    with WebDriverPool(min(POOL_SIZE, SCRAPE_WORKERS)) as pool:
+
+        def run_brand(url):
+            brand_started = time.time()
+            # Kept out here so a brand that fails partway still reports the rows it wrote
+            counts = {'products': 0}
+            try:
+                update(url, status='running')
+                label = brand_label(url)
+                csv_file, products, processed, failed = scrape_and_process(
+                    url, label, remover, pool, os.path.join(OUTPUT_FOLDER, label), incremental, counts
+                )
+                update(url, status='done' if products else 'failed', csv=csv_file, products=products,
+                       processed=processed, failed=failed, seconds=time.time() - brand_started)
+            except Exception as e:
+                print(f"\n✗ Error processing {url}: {e}")
+                update(url, status='failed', products=counts['products'],
+                       seconds=time.time() - brand_started)
+
+        with ThreadPoolExecutor(max_workers=SCRAPE_WORKERS) as executor:
+            list(executor.map(run_brand, urls))
+        pool.print_stats()
+
+    return progress
+
+def save_batch_summary(progress):
+    """Write per-brand results next to the CSVs and print them"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{OUTPUT_DIR}/batch_{timestamp}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(progress, f, indent=2)
+
+    print("\nBrand                          Status   Products  Processed  Failed")
+    for brand in progress.values():
+        print(f"{brand['brand'][:30]:<30} {brand['status']:<8} {brand['products']:>8} "
+              f"{brand['processed']:>10} {brand['failed']:>7}")
+    print(f"\nBatch summary saved to {filename}")
 
 def main():
-    if not REPLICATE_API_TOKEN:
-        print("Error: REPLICATE_API_TOKEN not found in .env file")
+    parser = argparse.ArgumentParser(description="Scrape ShopStyle brand pages and remove product image backgrounds")
+    parser.add_argument('urls', nargs='*', help="ShopStyle browse URLs to scrape")
+    parser.add_argument('--batch', metavar='FILE', help="file with one ShopStyle browse URL per line")
+    parser.add_argument('--incremental', action='store_true',
+                        help="save what changed since the last run and only process new or changed images")
+    args = parser.parse_args()
+
+    # BG_REMOVER picks the backend; only the replicate one needs an API token
+    try:
+        remover = get_remover()
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
         exit(1)
 
+    urls = list(args.urls)
+    if args.batch:
+        urls += read_url_file(args.batch)
+    if urls:
+        print(f"ShopStyle Scraper and Background Remover: {len(urls)} brands")
+        progress = run_batch(urls, remover, args.incremental)
+        save_batch_summary(progress)
+        bg_cache.get_cache().print_stats()
+        http_client.print_connection_stats()
+        return
+
     print("ShopStyle Scraper and Background Remover")
     print("Takes about 60 seconds to run entirely.")
     print("Enter the ShopStyle URL to scrape (e.g., https://www.shopstyle.com/browse/men/gucci):")
     url = input().strip()
     category = url.split('/')[-1]
     
-    # Step 1: Scrape products
+    # Products are saved and their backgrounds removed while the page is still being scraped
     print(f"\nStarting to scrape {url}...")
-    html_content = get_formatted_html(url)
-    if not html_content:
-        print("Failed to get HTML content. Exiting.")
+    try:
+        csv_file, products, processed, failed = scrape_and_process(url, category, remover, incremental=args.incremental)
+    except Exception as e:
+        print(f"\n✗ Error processing {url}: {e}")
+        return
+    if not products:
+        print("No products found. Exiting.")
         return
     
-    # Step 2: Extract and save product information
-    print("\nExtracting product information...")
-    products = extract_product_info(html_content)
-    csv_file = save_to_csv(products, category)
-    print(f"\nFound {len(products)} products")
+    print(f"\nFound {products} products")
     print(f"Product data saved to {csv_file}")
-    
-    # Step 3: Process background removal
-    process_products_backgrounds(products)
-    print("\nBackground removal process completed!")
+    print(f"Background removal process completed! {processed} processed, {failed} failed")
+    bg_cache.get_cache().print_stats()
+    http_client.print_connection_stats()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
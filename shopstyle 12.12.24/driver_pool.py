@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+# Browsers kept open at once
+POOL_SIZE = int(os.getenv('DRIVER_POOL_SIZE', '3'))
+# A browser is replaced after this many pages to keep its memory in check
+MAX_PAGES_PER_DRIVER = int(os.getenv('DRIVER_MAX_PAGES', '20'))
+
+
+def new_driver():
+    """Start a headless Chrome that doesn't download images
+
+    Scraping only needs each image's src attribute, so skipping the image
+    bytes saves bandwidth and renderer memory.
+    """
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+    chrome_options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+    return webdriver.Chrome(options=chrome_options)
+
+
+class _PooledDriver:
+    def __init__(self):
+        self.driver = None
+        self.pages = 0
+
+
+class WebDriverPool:
+    """A fixed set of long-lived headless browsers shared between threads
+
+    Drivers are started lazily, checked before every job, cleaned after it,
+    and replaced after max_pages pages or when they stop responding. Use it
+    as a context manager so every browser is quit, even after an error.
+    """
+
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_DRIVER):
+        self.size = size
+        self.max_pages = max_pages
+        self.idle = queue.Queue()
+        self.slots = [_PooledDriver() for _ in range(size)]
+        for slot in self.slots:
+            self.idle.put(slot)
+        self.lock = threading.Lock()
+        self.started = 0
+        self.recycled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _quit(self, slot):
+        if slot.driver is not None:
+            try:
+                slot.driver.quit()
+            except Exception as e:
+                print(f"Error closing browser: {e}")
+        slot.driver = None
+        slot.pages = 0
+
+    def _is_healthy(self, slot):
+        try:
+            return slot.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _checkout(self):
+        """Take an idle browser, (re)starting it if it is missing, worn out or broken"""
+        slot = self.idle.get()
+        try:
+            if slot.driver is not None and (slot.pages >= self.max_pages or not self._is_healthy(slot)):
+                self._quit(slot)
+                with self.lock:
+                    self.recycled += 1
+            if slot.driver is None:
+                slot.driver = new_driver()
+                with self.lock:
+                    self.started += 1
+        except Exception:
+            # Hand the slot back so other jobs don't wait on it forever
+            self.idle.put(slot)
+            raise
+        return slot
+
+    def _clean(self, slot):
+        """Leave no cookies, storage or page state behind for the next job"""
+        try:
+            slot.driver.delete_all_cookies()
+            slot.driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+            slot.driver.get("about:blank")
+        except Exception:
+            # A browser that can't be cleaned isn't reused
+            self._quit(slot)
+
+    def run(self, job, url):
+        """Run job(driver, url) on a pooled browser and return its result"""
+        slot = self._checkout()
+        try:
+            slot.pages += 1
+            return job(slot.driver, url)
+        finally:
+            self._clean(slot)
+            self.idle.put(slot)
+
+    def close(self):
+        for slot in self.slots:
+            self._quit(slot)
+
+    def print_stats(self):
+        print(f"Browsers: {self.started} started, {self.recycled} recycled")
@@ -0,0 +1,66 @@
+import os
+
+# Stop once the product grid hasn't changed for this long (seconds)
+SCROLL_SETTLE_TIME = float(os.getenv('SCROLL_SETTLE_TIME', '1.5'))
+# Give up on pages that keep growing after this long (seconds)
+SCROLL_TIMEOUT = float(os.getenv('SCROLL_TIMEOUT', '60'))
+
+# Runs inside the page as a single async script. A MutationObserver tracks how
+# many product cells exist and how many of their images have a real src; any
+# change restarts the settle timer. The page is scrolled a viewport per frame
+# so lazy loaders fire, and the callback is invoked once the grid is stable.
+_SCROLL_SCRIPT = """
+const [cellSelector, imageSelector, settleMs, timeoutMs, done] = arguments;
+const snapshot = () => {
+    const cells = document.querySelectorAll(cellSelector);
+    let images = 0;
+    for (const cell of cells) {
+        const img = cell.querySelector(imageSelector);
+        if (img && img.getAttribute('src')) images++;
+    }
+    return [cells.length, images];
+};
+
+let [cells, images] = snapshot();
+const start = performance.now();
+let lastChange = start;
+const observer = new MutationObserver(() => {
+    const [c, i] = snapshot();
+    if (c !== cells || i !== images) {
+        cells = c;
+        images = i;
+        lastChange = performance.now();
+    }
+});
+observer.observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['src']});
+
+const step = () => {
+    window.scrollBy(0, window.innerHeight);
+    const root = document.documentElement;
+    const atBottom = window.scrollY + window.innerHeight >= root.scrollHeight - 2;
+    const now = performance.now();
+    const timedOut = now - start >= timeoutMs;
+    if ((atBottom && now - lastChange >= settleMs) || timedOut) {
+        observer.disconnect();
+        done({cells: cells, images: images, seconds: (now - start) / 1000, timed_out: timedOut});
+        return;
+    }
+    requestAnimationFrame(step);
+};
+step();
+"""
+
+
+def scroll_until_stable(driver, cell_selector, image_selector='img',
+                        settle_time=SCROLL_SETTLE_TIME, timeout=SCROLL_TIMEOUT):
+    """Scroll to the end of a lazy-loading grid and return once it stops growing
+
+    Everything happens in one injected script, so the only WebDriver round trip
+    is the final result: a dict with the number of cells, how many of their
+    images have a src, the seconds spent and whether the timeout was hit.
+    """
+    # The script must be allowed to run a little longer than its own timeout
+    driver.set_script_timeout(timeout + 10)
+    return driver.execute_async_script(
+        _SCROLL_SCRIPT, cell_selector, image_selector, settle_time * 1000, timeout * 1000
+    )
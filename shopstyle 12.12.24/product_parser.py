@@ -0,0 +1,124 @@
+import io
+import os
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# 'lxml' streams the page through libxml2; 'bs4' is the original BeautifulSoup
+# parser, kept to check the two agree
+DEFAULT_BACKEND = os.getenv('HTML_PARSER', 'lxml' if etree is not None else 'bs4')
+
+CELL_TAG = 'web-product-cell-r'
+
+
+def extract_products_bs4(html_content):
+    """Extract product information from HTML with BeautifulSoup"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    products = []
+    product_cells = soup.find_all(CELL_TAG)
+
+    for cell in product_cells:
+        product = {}
+
+        img = cell.find('img', {'class': 'product-cell__image'})
+        if img and img.get('src', '').endswith('.jpg'):
+            product['image_url'] = img.get('src')
+
+        brand = cell.find('span', {'class': 'ss-t-text-ellipsis ss-w-full'})
+        if brand:
+            product['brand'] = brand.text.strip()
+
+        name = cell.find('span', {'data-test': 'product-cell__product-name'})
+        if name:
+            product['product_name'] = name.text.strip()
+
+        price = cell.find('span', {'data-test': 'product-cell__price'})
+        if price:
+            product['price'] = price.text.strip()
+
+        retailer = cell.find('span', {'data-test': 'product-cell__retailer-link'})
+        if retailer:
+            product['retailer'] = retailer.text.strip()
+
+        if product:
+            products.append(product)
+
+    return products
+
+
+if etree is not None:
+    # Compiled once; each matches the same element as the cell.find() above
+    _IMAGE = etree.XPath(".//img[contains(concat(' ', normalize-space(@class), ' '), ' product-cell__image ')][1]")
+    _TEXT_FIELDS = [
+        ('brand', etree.XPath(".//span[@class='ss-t-text-ellipsis ss-w-full'][1]")),
+        ('product_name', etree.XPath(".//span[@data-test='product-cell__product-name'][1]")),
+        ('price', etree.XPath(".//span[@data-test='product-cell__price'][1]")),
+        ('retailer', etree.XPath(".//span[@data-test='product-cell__retailer-link'][1]")),
+    ]
+
+
+def iter_products_lxml(html_content):
+    """Yield products one cell at a time while libxml2 parses the page
+
+    Each cell is discarded as soon as its fields are read, so memory stays
+    flat however many products the page has.
+    """
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
+
+    for _, cell in etree.iterparse(io.BytesIO(html_content), events=('end',), tag=CELL_TAG,
+                                   html=True, encoding='utf-8'):
+        product = {}
+
+        images = _IMAGE(cell)
+        if images and images[0].get('src', '').endswith('.jpg'):
+            product['image_url'] = images[0].get('src')
+
+        for field, xpath in _TEXT_FIELDS:
+            found = xpath(cell)
+            if found:
+                product[field] = ''.join(found[0].itertext()).strip()
+
+        # Free the cell and the siblings parsed before it
+        cell.clear()
+        while cell.getprevious() is not None:
+            del cell.getparent()[0]
+
+        if product:
+            yield product
+
+
+def extract_products_lxml(html_content):
+    """Extract product information from HTML with lxml"""
+    return list(iter_products_lxml(html_content))
+
+
+BACKENDS = {
+    'lxml': extract_products_lxml,
+    'bs4': extract_products_bs4,
+}
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser '{backend}', choose from: {', '.join(BACKENDS)}")
+    if backend == 'lxml' and etree is None:
+        raise RuntimeError("The lxml parser needs the lxml package: pip install lxml")
+
+
+def extract_products(html_content, backend=DEFAULT_BACKEND):
+    """Extract product information from HTML with the chosen backend"""
+    _check_backend(backend)
+    return BACKENDS[backend](html_content)
+
+
+def iter_products(html_content, backend=DEFAULT_BACKEND):
+    """Yield products as they are parsed; only the lxml backend streams"""
+    _check_backend(backend)
+    if backend == 'lxml':
+        return iter_products_lxml(html_content)
+    return iter(extract_products_bs4(html_content))
@@ -0,0 +1,83 @@
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from scraper_common import http_client
+
+# Hotyon (Ultimate Search Filter) endpoint the store's collection pages load their grids from
+SEARCH_URL = os.getenv('HOTYON_SEARCH_URL', 'https://svc-1000-usf.hotyon.com/search')
+API_KEY = os.getenv('HOTYON_API_KEY', '20524fb1-c9b3-44ff-a4ff-ac7a0af066cf')
+
+# Products per request, and how many requests are in flight at once
+PAGE_SIZE = int(os.getenv('HOTYON_PAGE_SIZE', '45'))
+MAX_IN_FLIGHT = int(os.getenv('HOTYON_MAX_IN_FLIGHT', '4'))
+
+
+def fetch_window(collection_id, skip, take=PAGE_SIZE):
+    """Fetch one skip/take window of a collection; returns the response's data object"""
+    params = {
+        'q': '',
+        'apiKey': API_KEY,
+        'country': 'US',
+        'locale': 'en',
+        'getProductDescription': 0,
+        'collection': collection_id,
+        'skip': skip,
+        'take': take,
+    }
+    response = http_client.get(SEARCH_URL, params=params)
+    response.raise_for_status()
+    return response.json().get('data') or {}
+
+
+def iter_windows(collection_id, take=PAGE_SIZE, max_in_flight=MAX_IN_FLIGHT):
+    """Yield each window's items of a collection in listing order
+
+    The first window gives the total; the rest are fetched concurrently, at
+    most max_in_flight ahead of the one being consumed, so only that many
+    pages are held in memory. A window that fails is reported and skipped.
+    """
+    try:
+        data = fetch_window(collection_id, 0, take)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error fetching collection {collection_id}: {e}")
+        return
+    items = data.get('items') or []
+    total = data.get('total') or len(items)
+    print(f"Collection {collection_id}: {total} products")
+    del data
+    yield items
+
+    skips = iter(range(take, total, take))
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = deque((skip, executor.submit(fetch_window, collection_id, skip, take))
+                        for skip in itertools.islice(skips, max_in_flight))
+        while pending:
+            skip, future = pending.popleft()
+            next_skip = next(skips, None)
+            if next_skip is not None:
+                pending.append((next_skip, executor.submit(fetch_window, collection_id, next_skip, take)))
+            try:
+                items = future.result().get('items') or []
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error fetching collection {collection_id} at skip={skip}: {e}")
+                continue
+            yield items
+
+
+def iter_products(collection_ids, take=PAGE_SIZE, max_in_flight=MAX_IN_FLIGHT):
+    """Yield every product of the given collections once, in collection and listing order
+
+    Products are merged by id, so overlapping windows or collections don't
+    produce duplicates; only the ids seen so far are kept.
+    """
+    seen = set()
+    for collection_id in collection_ids:
+        for items in iter_windows(collection_id, take, max_in_flight):
+            for item in items:
+                product_id = item.get('id') or item.get('urlName') or item.get('title')
+                if product_id in seen:
+                    continue
+                seen.add(product_id)
+                yield item
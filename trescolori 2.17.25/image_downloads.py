@@ -0,0 +1,99 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from scraper_common import http_client
+
+# Downloads running at once, and at most this many against any one host
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '16'))
+PER_HOST_LIMIT = int(os.getenv('DOWNLOAD_PER_HOST', '8'))
+
+# HEAD every image first so the largest ones start first and don't finish last
+PROBE_SIZES = os.getenv('PROBE_IMAGE_SIZES', '1') != '0'
+
+# Let the Shopify CDN resize and re-encode images, e.g. SHOPIFY_IMAGE_WIDTH=1024
+# SHOPIFY_IMAGE_FORMAT=webp; unset downloads the originals
+IMAGE_WIDTH = os.getenv('SHOPIFY_IMAGE_WIDTH')
+IMAGE_FORMAT = os.getenv('SHOPIFY_IMAGE_FORMAT')
+
+
+def is_shopify_cdn(url):
+    parts = urlsplit(url)
+    return parts.netloc == 'cdn.shopify.com' or parts.path.startswith('/cdn/shop/')
+
+
+def shopify_image_url(url, width=IMAGE_WIDTH, image_format=IMAGE_FORMAT):
+    """Add the CDN's width/format parameters to a Shopify image URL"""
+    if not (width or image_format) or not is_shopify_cdn(url):
+        return url
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name not in ('width', 'format')]
+    if width:
+        query.append(('width', str(width)))
+    if image_format:
+        query.append(('format', image_format))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def image_extension(image_format=IMAGE_FORMAT):
+    """File extension for images fetched in image_format"""
+    if image_format in ('webp', 'png', 'gif'):
+        return f".{image_format}"
+    return '.jpg'
+
+
+def probe_size(url):
+    """Content-Length of url from a HEAD request; 0 when it can't be told"""
+    try:
+        response = http_client.get_session().head(url, allow_redirects=True)
+        return int(response.headers.get('Content-Length') or 0)
+    except (requests.RequestException, ValueError):
+        return 0
+
+
+class HostLimiter:
+    """One semaphore per host, so no host gets more than `limit` requests at once"""
+
+    def __init__(self, limit=PER_HOST_LIMIT):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+
+def download_all(jobs, download, workers=DOWNLOAD_WORKERS, per_host=PER_HOST_LIMIT, probe=PROBE_SIZES):
+    """Download (url, path) jobs concurrently, yielding (url, path, ok) as each finishes
+
+    download(url, path) does one download and returns True on success. With
+    probe, every URL's size is read with a HEAD request first and the largest
+    are started first, so a few big images don't end up as the slow tail.
+    """
+    jobs = list(jobs)
+    limiter = HostLimiter(per_host)
+
+    def limited(function, url, *args):
+        with limiter.slot(url):
+            return function(url, *args)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if probe and len(jobs) > 1:
+            sizes = list(executor.map(lambda job: limited(probe_size, job[0]), jobs))
+            jobs = [job for _, job in sorted(zip(sizes, jobs), key=lambda pair: pair[0], reverse=True)]
+
+        futures = {executor.submit(limited, download, url, path): (url, path) for url, path in jobs}
+        for future in as_completed(futures):
+            url, path = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"\nError downloading image {url}: {e}")
+                ok = False
+            yield url, path, ok
@@ -1,18 +1,24 @@
 import requests
 import csv
+import io
 import os
+import sys
 import json
 from urllib.parse import urljoin
 import time
 from pathlib import Path
-import replicate
 from dotenv import load_dotenv
 from PIL import Image
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import http_client
+from scraper_common.bg_removers import get_remover, remove_backgrounds
 
 # Load environment variables
 load_dotenv()
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+if REPLICATE_API_TOKEN:
+    os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
 
 def create_folder_structure(category_name):
     """Create necessary folders for storing data"""
@@ -34,7 +40,7 @@ def create_folder_structure(category_name):
 def fetch_and_parse_data(url):
     """Fetch data from the URL and parse the JSON response"""
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
@@ -79,7 +85,7 @@ def save_to_csv(data, filepath):
 def download_image(url, filepath):
     """Download image from URL"""
     try:
-        response = requests.get(urljoin('https://www.uncommongoods.com', url))
+        response = http_client.get(urljoin('https://www.uncommongoods.com', url))
         response.raise_for_status()
         
         with open(filepath, 'wb') as f:
@@ -89,43 +95,28 @@ def download_image(url, filepath):
         print(f"\nError downloading image {url}: {e}")
         return False
 
-def remove_background(input_path, output_path):
-    """Remove background from image using Replicate API"""
+def remove_background(input_path, output_path, remover):
+    """Remove background from image with the chosen backend (BG_REMOVER)"""
     try:
         # Convert to PNG first
-        temp_png_path = input_path.replace('.jpg', '.png')
         with Image.open(input_path) as img:
             # Convert to RGBA to ensure transparency support
-            img = img.convert('RGBA')
-            img.save(temp_png_path, 'PNG')
+            buffer = io.BytesIO()
+            img.convert('RGBA').save(buffer, 'PNG')
 
-        # Use the same model as in scraper.py
-        output = replicate.run(
-            "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": open(temp_png_path, "rb")}
-        )
+        # Images processed before come from the background cache
+        output = remove_backgrounds(remover, [buffer.getvalue()])[0]
+        if output is None:
+            return False
 
-        # Download and save the processed image
-        response = requests.get(output, stream=True)
-        response.raise_for_status()
-        
         with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
-        # Clean up temporary PNG file
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
-            
+            file.write(output)
         return True
     except Exception as e:
         print(f"\nError removing background from {input_path}: {e}")
-        # Clean up temporary PNG file in case of error
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
         return False
 
-def process_data_and_images(data, folders):
+def process_data_and_images(data, folders, remover):
     """Process all data and images"""
     if not data:
         print("No data to process")
@@ -152,7 +143,7 @@ def process_data_and_images(data, folders):
                 successful_downloads += 1
                 
                 # Remove background
-                if remove_background(original_path, processed_path):
+                if remove_background(original_path, processed_path, remover):
                     successful_bg_removals += 1
                 else:
                     failed_bg_removals += 1
@@ -169,6 +160,13 @@ def process_data_and_images(data, folders):
     return successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals
 
 def main():
+    # BG_REMOVER picks the backend; only the replicate one needs an API token
+    try:
+        remover = get_remover()
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        exit(1)
+
     # Define the categories and their URLs
     categories = {
         "girlfriend": "https://www.uncommongoods.com/br/search/?account_id=5343&auth_key=&domain_key=uncommongoods&request_type=search&br_origin=searchBox&query.precision=text_match_precision&facet.precision=standard&query.relaxation=product_type&query.spellcorrect=term_frequency&search_type=keyword&fl=pid%2Ctitle%2Cthumb_image%2Cthumb_image_alt%2Curl%2Creviews%2Creviews_count%2Cprice_range%2Cbr_min_sale_price%2Cbr_max_sale_price%2Cdays_live%2Cmin_inventory%2Cis_customizable%2Cnum_skus%2Cis_coming_soon%2Cvideo_link%2Cmin_age%2Cmax_age%2Cis_ship_delay%2Cavailability_attr%2Cavailable_inventory%2Cshow_only_on_sale_page%2Cships_within%2Carrives_by_holiday%2Cis_experience%2Cmin_price_sku%2Cmax_price_sku%2Citem_type_id%2Cexperience_dates%2Cavailable_ship_methods%2Csubscription_min_shipments%2Csubscription_min_interval%2Cnew%2Csku_desc1%2Csku_desc2%2Csku_main_image&efq=-show_only_on_sale_page:%222%22&facet.field=ug_cat_internal&facet.field=recipients&facet.field=item_type_id&q=girlfriend%20gifts&rows=120&start=0&custom_country=US%26custom_country%3D%22US&_br_uid_2=uid=7621295855054:v=16.0:ts=1737049094254:hc=68:cdp_segments=NjYyN2QyYjY4MzYyYmViNTUwMmZjYjRiOjY2MjdkMmI2ODM2MmJlYjU1MDJmY2IxNyw2NjY4OGE5Y2ZlNjEyMzQ0NTYzNDY5MWI6NjY2ODhhOWNmZTYxMjM0NDU2MzQ2OGZk&request_id=2025-2-101600&url=%22%2Fsearch%3Fq%3Dgirlfriend%2520gifts&ref_url=%22%2Fsearch%22",
@@ -211,7 +209,7 @@ def main():
                 
                 # Process images - passing the folders dictionary
                 successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals = process_data_and_images(
-                    products, folders
+                    products, folders, remover
                 )
 
                 # Log results
@@ -225,5 +223,7 @@ def main():
             print(f"Error processing category {category}: {str(e)}")
             continue
 
+    http_client.print_connection_stats()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
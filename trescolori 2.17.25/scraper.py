@@ -1,14 +1,31 @@
-import requests
-import pandas as pd
 import os
+import sys
 import json
+import itertools
+from collections import namedtuple
 from pathlib import Path
-import time
 from dotenv import load_dotenv
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import http_client
+from scraper_common.download_cache import get_download_cache, print_download_stats
+from scraper_common.outputs import ParquetOutput
+from hotyon import iter_products
+from image_downloads import download_all, image_extension, shopify_image_url
 
 # Load environment variables (keeping this in case needed for future modifications)
 load_dotenv()
 
+# One extracted product; a tuple, so a large catalog costs a few small objects per product.
+# id is the row number, product_id the store's own id for the product
+Product = namedtuple('Product', ['id', 'product_id', 'title', 'price', 'image_url'])
+
+# Prices are stored as numbers and shown as dollars
+PRICE_FORMAT = '"$"#,##0.00'
+
 def create_folder_structure():
     """Create necessary folders for storing data"""
     # Create main folders
@@ -20,128 +37,120 @@ def create_folder_structure():
         'images': 'data/images'
     }
 
-def fetch_data(urls):
-    """Fetch data from multiple URLs and combine the results"""
-    all_products = []
-    
-    for url in urls:
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'data' in data and 'items' in data['data']:
-                all_products.extend(data['data']['items'])
-                
-        except requests.RequestException as e:
-            print(f"Error fetching data from {url}: {e}")
-            continue
-            
-    return all_products
+def fetch_data(collection_ids):
+    """Yield every raw product of the given collections once, a page at a time"""
+    return iter_products(collection_ids)
 
 def extract_product_data(products):
-    """Extract relevant fields from the products data"""
-    extracted_data = []
-    
+    """Yield a compact Product for each raw product, which can then be dropped"""
     for idx, product in enumerate(products, 1):
         # Get the lowest price from variants
-        if 'variants' in product and product['variants']:
-            min_price = min(variant['price'] for variant in product['variants'])
-        else:
-            min_price = None
+        min_price = min((variant['price'] for variant in product.get('variants') or []), default=None)
             
         # Get the first image URL
         image_url = None
-        if 'images' in product and product['images']:
+        if product.get('images'):
             image_url = product['images'][0]['url']
             if image_url.startswith('//'):
                 image_url = 'https:' + image_url
                 
-        product_data = {
-            'id': idx,
-            'title': product.get('title', ''),
-            'price': min_price,
-            'image_url': image_url
-        }
-        extracted_data.append(product_data)
-    
-    return extracted_data
+        yield Product(idx, product.get('id'), product.get('title', ''), min_price, image_url)
 
-def save_to_excel(data, filepath):
-    """Save extracted data to Excel file"""
-    if not data:
-        print("No data to save to Excel")
-        return
-        
-    df = pd.DataFrame(data)
-    df['price'] = df['price'].apply(lambda x: f"${x:.2f}" if x else '')
-    df = df.drop('image_url', axis=1)  # Remove image_url from Excel output
-    df.to_excel(filepath, index=False)
+def save_products(products, excel_path, parquet_path, category='all'):
+    """Write products to Excel and Parquet in one pass, as they arrive
+
+    Only the (id, image_url) pairs needed to download images are kept and
+    returned, so the catalog itself is never held in memory.
+    """
+    products = iter(products)
+    first = next(products, None)
+    if first is None:
+        print("No data to save")
+        return []
+
+    # A write-only workbook streams rows to disk instead of keeping them in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+
+    header = []
+    for name in ('id', 'title', 'price'):  # image_url is left out of the Excel output
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    count = 0
+    images = []
+    with ParquetOutput(parquet_path, 'trescolori', category) as parquet:
+        for item in itertools.chain([first], products):
+            price = WriteOnlyCell(sheet, value=item.price)
+            price.number_format = PRICE_FORMAT
+            sheet.append([item.id, item.title, price])
+            count += 1
+            parquet.append({
+                'rank': item.id,
+                'product_id': item.product_id,
+                'title': item.title,
+                'price': item.price,
+                'image_url': item.image_url
+            })
+            if item.image_url:
+                images.append((item.id, item.image_url))
+    workbook.save(excel_path)
+    print(f"Extracted {count} products")
+    if parquet.enabled:
+        print(f"Typed product data saved to {parquet_path}")
+    return images
 
 def download_image(url, filepath):
     """Download image from URL"""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        # Revalidates images saved by an earlier run instead of re-fetching them
+        get_download_cache(os.path.dirname(filepath)).download(url, filepath)
         return True
     except Exception as e:
         print(f"\nError downloading image {url}: {e}")
         return False
 
-def process_images(data, folders):
-    """Process all images"""
-    if not data:
+def process_images(images, folders):
+    """Download all images concurrently, largest first; images is a list of (id, image_url)"""
+    if not images:
         print("No data to process")
         return
     
-    total_images = len(data)
+    total_images = len(images)
     successful_downloads = 0
     
     print("Starting image downloads...")
     
-    for item in data:
-        if item['image_url']:
-            # Generate filename using sequential ID
-            image_filename = f"{item['id']}.jpg"
-            image_path = os.path.join(folders['images'], image_filename)
-            
-            # Download image
-            if download_image(item['image_url'], image_path):
-                successful_downloads += 1
-                print(f"\rDownloaded ({successful_downloads}/{total_images}) Images", end='', flush=True)
-            
-            time.sleep(0.1)  # Small delay to prevent overwhelming the server
+    # Files are named by sequential ID; SHOPIFY_IMAGE_WIDTH/FORMAT fetch resized images instead of originals
+    jobs = [(shopify_image_url(image_url), os.path.join(folders['images'], f"{item_id}{image_extension()}"))
+            for item_id, image_url in images]
+    for _, _, ok in download_all(jobs, download_image):
+        if ok:
+            successful_downloads += 1
+            print(f"\rDownloaded ({successful_downloads}/{total_images}) Images", end='', flush=True)
     
     print("\nImage downloads completed!")
     print(f"Successfully downloaded: {successful_downloads}/{total_images} images")
 
 def main():
-    # URLs to scrape
-    urls = [
-        "https://svc-1000-usf.hotyon.com/search?q=&apiKey=20524fb1-c9b3-44ff-a4ff-ac7a0af066cf&country=US&locale=en&getProductDescription=0&collection=155236663369&skip=0&take=45",
-        "https://svc-1000-usf.hotyon.com/search?q=&apiKey=20524fb1-c9b3-44ff-a4ff-ac7a0af066cf&country=US&locale=en&getProductDescription=0&collection=155302461513&skip=0&take=39"
-    ]
+    # Collections to scrape
+    collection_ids = ["155236663369", "155302461513"]
     
     # Create folder structure
     folders = create_folder_structure()
     
-    # Fetch and process data
-    print("Fetching product data...")
-    raw_data = fetch_data(urls)
-    
-    print("Extracting product information...")
-    products_data = extract_product_data(raw_data)
-    
-    # Save to Excel
+    # Raw pages are reduced to Product records, written out as they arrive and then dropped
     excel_path = os.path.join(folders['main'], 'products.xlsx')
-    print(f"Saving product data to {excel_path}...")
-    save_to_excel(products_data, excel_path)
+    print(f"Fetching product data and saving it to {excel_path}...")
+    images = save_products(extract_product_data(fetch_data(collection_ids)), excel_path,
+                           os.path.join(folders['main'], 'products.parquet'))
     
     # Process images
-    process_images(products_data, folders)
+    process_images(images, folders)
+    print_download_stats()
+    http_client.print_connection_stats()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,128 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scraper_common import http_client
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:
+    ACCEPT_ENCODING = 'gzip,deflate'
+
+# Rows requested per page of search results
+PAGE_SIZE = 120
+
+# Number of pages fetched at the same time once the total is known
+PAGE_WORKERS = 8
+
+# Ask for a compressed response; urllib3 decodes it, and offers br when brotli is installed
+HEADERS = {'Accept-Encoding': ACCEPT_ENCODING}
+
+_transfer = {'pages': 0, 'wire': 0, 'decoded': 0}
+_transfer_lock = threading.Lock()
+
+
+def set_query_param(url, name, value):
+    """Set a query parameter without re-encoding the rest of the URL"""
+    pattern = re.compile(rf'([?&]{re.escape(name)}=)[^&]*')
+    if pattern.search(url):
+        return pattern.sub(lambda match: f"{match.group(1)}{value}", url, count=1)
+    return f"{url}&{name}={value}"
+
+
+def remove_query_param(url, name):
+    """Drop every occurrence of a query parameter"""
+    return re.sub(rf'(?<=[?&]){re.escape(name)}=[^&]*(&|$)', '', url).rstrip('&')
+
+
+def search_url(url, fields):
+    """Have a search URL return only `fields` for each doc and no facet counts
+
+    The URLs copied from the site ask for ~35 fields and three facets per
+    page, nearly all of which the scrapers throw away.
+    """
+    url = set_query_param(url, 'fl', '%2C'.join(fields))
+    return remove_query_param(url, 'facet.field')
+
+
+def page_url(url, start, rows=PAGE_SIZE):
+    """Point a search URL at the page beginning at `start`"""
+    return set_query_param(set_query_param(url, 'rows', rows), 'start', start)
+
+
+def fetch_page(url):
+    """GET a search page, compressed if the server allows, and log its size"""
+    response = http_client.get(url, headers=HEADERS)
+    log_response_size(url, response)
+    return response
+
+
+def log_response_size(url, response):
+    """Print the bytes a page took over the wire and once decoded"""
+    decoded = len(response.content)
+    try:
+        # Bytes read from the socket, before decompression
+        wire = response.raw.tell() or decoded
+    except (AttributeError, TypeError):
+        wire = int(response.headers.get('Content-Length') or decoded)
+    with _transfer_lock:
+        _transfer['pages'] += 1
+        _transfer['wire'] += wire
+        _transfer['decoded'] += decoded
+
+    start = re.search(r'[?&]start=(\d+)', url)
+    encoding = response.headers.get('Content-Encoding', 'identity')
+    print(f"Page at {start.group(1) if start else 0}: {wire / 1024:.1f} KB transferred, "
+          f"{decoded / 1024:.1f} KB decoded ({encoding})")
+
+
+def print_transfer_stats():
+    """Print the total size of the search pages fetched so far"""
+    if not _transfer['pages']:
+        return
+    print(f"Search pages: {_transfer['pages']} fetched, {_transfer['wire'] / 1024:.1f} KB transferred, "
+          f"{_transfer['decoded'] / 1024:.1f} KB decoded")
+
+
+class IncompleteListingError(Exception):
+    """Some pages of a search couldn't be fetched; `starts` holds their offsets"""
+
+    def __init__(self, starts):
+        self.starts = sorted(starts)
+        super().__init__(f"{len(self.starts)} page(s) missing, starting at {', '.join(map(str, self.starts))}")
+
+
+def iter_pages(build_url, fetch, rows=PAGE_SIZE, max_workers=PAGE_WORKERS):
+    """Yield every page of a Bloomreach search as soon as it arrives
+
+    build_url(start) returns the URL of the page beginning at `start` and
+    fetch(url) returns its parsed JSON. The first page is fetched on its own to
+    read numFound; the remaining offsets are fetched in parallel and yielded in
+    completion order. Pages that fail or come back empty are skipped, and
+    IncompleteListingError is raised once every other page has been yielded,
+    so callers can tell a partial listing from a complete one.
+    """
+    first_page = fetch(build_url(0))
+    if not first_page:
+        raise IncompleteListingError([0])
+    yield first_page
+
+    num_found = first_page.get('response', {}).get('numFound', 0)
+    offsets = range(rows, num_found, rows)
+    if not offsets:
+        return
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch, build_url(start)): start for start in offsets}
+        for future in as_completed(futures):
+            try:
+                page = future.result()
+            except Exception as e:
+                print(f"\nError fetching page starting at {futures[future]}: {e}")
+                page = None
+            if page:
+                yield page
+            else:
+                failed.append(futures[future])
+    if failed:
+        raise IncompleteListingError(failed)
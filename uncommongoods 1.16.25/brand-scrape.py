@@ -1,7 +1,7 @@
 import os
+import sys
 import requests
 import json
-import replicate
 import csv
 from dotenv import load_dotenv
 from urllib.parse import urlparse
@@ -13,13 +13,18 @@ from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup
 import time
 from datetime import datetime
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import http_client
+from scraper_common.bg_removers import get_remover, remove_backgrounds
 
 # Load environment variables
 load_dotenv()
 
 # Configuration
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+if REPLICATE_API_TOKEN:
+    os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
 OUTPUT_DIR = "scraped_data"
 OUTPUT_FOLDER = "processed_images"
 SCROLL_PAUSE_TIME = 1
@@ -134,8 +139,8 @@ def save_to_csv(products, category):
     
     return filename
 
-def remove_background_with_replicate(image_url, product_name):
-    """Remove background from product image"""
+def remove_background(image_url, product_name, remover):
+    """Remove background from product image with the chosen backend (BG_REMOVER)"""
     try:
         if not is_valid_url(image_url):
             print(f"✗ Invalid URL for {product_name}")
@@ -144,24 +149,20 @@ def remove_background_with_replicate(image_url, product_name):
         safe_name = "".join(c for c in product_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
         output_path = os.path.join(OUTPUT_FOLDER, f"{safe_name}.png")
 
-        output = replicate.run(
-            "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": image_url}
-        )
-
-        response = requests.get(output, stream=True)
+        # The source image's bytes key the background cache
+        response = http_client.get(image_url)
         response.raise_for_status()
-        
+        output = remove_backgrounds(remover, [response.content])[0]
+        if output is None:
+            print(f"✗ Background removal failed: {product_name}")
+            return None
+
         with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
+            file.write(output)
 
         print(f"✓ Processed: {safe_name}")
         return output_path
 
-    except replicate.exceptions.ReplicateError as e:
-        print(f"✗ Replicate API Error: {product_name} - {str(e)}")
-        return None
     except requests.exceptions.RequestException as e:
         print(f"✗ Request Error: {product_name} - {str(e)}")
         return None
@@ -169,21 +170,25 @@ def remove_background_with_replicate(image_url, product_name):
         print(f"✗ Unexpected Error: {product_name} - {str(e)}")
         return None
 
-def process_products_backgrounds(products):
+def process_products_backgrounds(products, remover):
     """Process background removal for all products"""
     total = len(products)
     print(f"\nStarting background removal for {total} products...")
     
     for i, product in enumerate(products, 1):
         print(f"\nProcessing {i}/{total}: {product['product_name']}")
-        remove_background_with_replicate(
+        remove_background(
             product['image_url'],
-            product['product_name']  # Removed brand prefix
+            product['product_name'],  # Removed brand prefix
+            remover
         )
 
 def main():
-    if not REPLICATE_API_TOKEN:
-        print("Error: REPLICATE_API_TOKEN not found in .env file")
+    # BG_REMOVER picks the backend; only the replicate one needs an API token
+    try:
+        remover = get_remover()
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
         exit(1)
 
     print("ShopStyle Scraper and Background Remover")
@@ -207,8 +212,9 @@ def main():
     print(f"Product data saved to {csv_file}")
     
     # Step 3: Process background removal
-    process_products_backgrounds(products)
+    process_products_backgrounds(products, remover)
     print("\nBackground removal process completed!")
+    http_client.print_connection_stats()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
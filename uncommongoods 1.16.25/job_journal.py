@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import time
+
+JOURNAL_PATH = 'scrape_journal.db'
+
+# Item states, in the order an item reaches them
+FETCHED = 'fetched'
+DOWNLOADED = 'downloaded'
+CONVERTED = 'converted'
+BG_REMOVED = 'bg_removed'
+
+
+class JobJournal:
+    """Persistent record of how far each (category, item) got
+
+    Every state change is a single upsert into a WAL-mode SQLite database, so
+    checkpointing stays cheap with thousands of items and survives crashes.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                category TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (category, item_key)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS categories (
+                category TEXT PRIMARY KEY,
+                completed_at REAL NOT NULL
+            )
+        """)
+
+    def reset(self):
+        """Forget every previous run"""
+        with self.lock:
+            self.conn.execute("DELETE FROM items")
+            self.conn.execute("DELETE FROM categories")
+
+    def mark_fetched(self, category, item_keys):
+        """Record items found in a listing without touching ones already further along"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (category, item_key, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(category, key, FETCHED, now) for key in item_keys]
+            )
+            self.conn.execute("COMMIT")
+
+    def mark(self, category, item_key, state):
+        """Record that an item completed a stage"""
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO items (category, item_key, state, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (category, item_key)
+                   DO UPDATE SET state = excluded.state, error = NULL, updated_at = excluded.updated_at""",
+                (category, item_key, state, time.time())
+            )
+
+    def mark_failed(self, category, item_key, stage):
+        """Record that an item failed a stage; it keeps the last state it reached"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE items SET error = ?, updated_at = ? WHERE category = ? AND item_key = ?",
+                (f"{stage} failed", time.time(), category, item_key)
+            )
+
+    def finished_items(self, category):
+        """Keys of items in a category that made it all the way through"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT item_key FROM items WHERE category = ? AND state = ?", (category, BG_REMOVED)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_category_done(self, category):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO categories (category, completed_at) VALUES (?, ?)",
+                (category, time.time())
+            )
+
+    def is_category_done(self, category):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM categories WHERE category = ?", (category,)).fetchone()
+        return row is not None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
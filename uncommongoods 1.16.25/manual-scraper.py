@@ -1,18 +1,33 @@
 import requests
+import argparse
 import csv
+import itertools
 import os
+import sys
 import json
 from urllib.parse import urljoin
-import time
 from pathlib import Path
-import replicate
 from dotenv import load_dotenv
-from PIL import Image
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import bg_cache, http_client
+from scraper_common.bg_removers import BACKENDS, DEFAULT_BACKEND, get_remover, remove_backgrounds
+from scraper_common.download_cache import get_download_cache, print_download_stats
+from scraper_common.image_pipeline import run_image_pipeline
+from scraper_common.image_transforms import optimize_png, to_png
+from scraper_common.outputs import ParquetOutput
+from scraper_common.change_detection import ChangeDetector
+from bloomreach import IncompleteListingError, fetch_page, iter_pages, page_url, print_transfer_stats, search_url
+from job_journal import BG_REMOVED, JobJournal
+from product_index import ProductIndex, product_key
 
 # Load environment variables
 load_dotenv()
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+if REPLICATE_API_TOKEN:
+    os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+# The model accepts JPGs directly; set CONVERT_TO_PNG=1 to upload RGBA PNGs instead
+CONVERT_TO_PNG = os.getenv('CONVERT_TO_PNG') == '1'
 
 def create_folder_structure(category_name):
     """Create necessary folders for storing data"""
@@ -34,25 +49,31 @@ def create_folder_structure(category_name):
 def fetch_and_parse_data(url):
     """Fetch data from the URL and parse the JSON response"""
     try:
-        response = requests.get(url)
+        response = fetch_page(url)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
         print(f"Error fetching data: {e}")
         return None
 
+# The only Bloomreach fields extract_relevant_data reads; search URLs request just these
+SEARCH_FIELDS = ('pid', 'title', 'price_range', 'thumb_image', 'url')
+
 def extract_relevant_data(raw_data):
     """Extract relevant fields from the raw data"""
     if not raw_data or 'response' not in raw_data or 'docs' not in raw_data['response']:
         return []
     
+    # Number items by their rank in the full result set so pages can arrive in any order
+    start = raw_data['response'].get('start', 0)
     extracted_data = []
-    for idx, item in enumerate(raw_data['response']['docs'], 1):
+    for idx, item in enumerate(raw_data['response']['docs'], start + 1):
         # Get the lower price from price_range
         price = item.get('price_range', [0])[0] if item.get('price_range') else 0
         
         product_data = {
             'id': idx,  # Add sequential ID
+            'pid': item.get('pid', ''),
             'title': item.get('title', ''),
             'price': price,  # Only store the lower price
             'thumb_image': item.get('thumb_image', ''),
@@ -62,113 +83,127 @@ def extract_relevant_data(raw_data):
     
     return extracted_data
 
-def save_to_csv(data, filepath):
-    """Save extracted data to CSV file"""
-    if not data:
-        print("No data to save to CSV")
-        return
-    
+def stream_to_csv(pages, filepath, category):
+    """Append each page's products to the CSV (and Parquet) as the page arrives, then yield them as a list"""
     # Updated fieldnames to match new structure
-    fieldnames = ['id', 'title', 'price', 'thumb_image', 'url']
+    fieldnames = ['id', 'pid', 'title', 'price', 'thumb_image', 'url']
+    parquet_path = os.path.splitext(filepath)[0] + '.parquet'
     
-    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+    # Fetch the first page before touching the outputs, so a failed fetch leaves the last CSV intact
+    pages = iter(pages)
+    first_page = next(pages, None)
+    if first_page is None:
+        return
+    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile, \
+            ParquetOutput(parquet_path, 'uncommongoods', category) as parquet:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(data)
+        for page in itertools.chain([first_page], pages):
+            products = extract_relevant_data(page)
+            writer.writerows(products)
+            csvfile.flush()
+            for product in products:
+                parquet.append({
+                    'rank': product['id'],
+                    'product_id': product['pid'],
+                    'title': product['title'],
+                    'price': product['price'],
+                    'url': urljoin('https://www.uncommongoods.com', product['url']) if product['url'] else None,
+                    'image_url': urljoin('https://www.uncommongoods.com', product['thumb_image']) if product['thumb_image'] else None
+                })
+            yield products
 
 def download_image(url, filepath):
-    """Download image from URL"""
+    """Download image from URL, save it and return its bytes"""
     try:
-        response = requests.get(urljoin('https://www.uncommongoods.com', url))
-        response.raise_for_status()
-        
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        return True
+        # Revalidates images saved by an earlier run instead of re-fetching them
+        full_url = urljoin('https://www.uncommongoods.com', url)
+        return get_download_cache(os.path.dirname(filepath)).download_bytes(full_url, filepath)
     except Exception as e:
         print(f"\nError downloading image {url}: {e}")
-        return False
+        return None
 
-def remove_background(input_path, output_path):
-    """Remove background from image using Replicate API"""
-    try:
-        # Convert to PNG first
-        temp_png_path = input_path.replace('.jpg', '.png')
-        with Image.open(input_path) as img:
-            # Convert to RGBA to ensure transparency support
-            img = img.convert('RGBA')
-            img.save(temp_png_path, 'PNG')
-
-        # Use the same model as in scraper.py
-        output = replicate.run(
-            "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": open(temp_png_path, "rb")}
-        )
-
-        # Download and save the processed image
-        response = requests.get(output, stream=True)
-        response.raise_for_status()
-        
-        with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
-        # Clean up temporary PNG file
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
-            
-        return True
-    except Exception as e:
-        print(f"\nError removing background from {input_path}: {e}")
-        # Clean up temporary PNG file in case of error
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
-        return False
-
-def process_data_and_images(data, folders):
-    """Process all data and images"""
-    if not data:
-        print("No data to process")
-        return 0, 0, 0, 0
-    
-    total_images = len(data)
-    successful_downloads = 0
-    failed_downloads = 0
-    successful_bg_removals = 0
-    failed_bg_removals = 0
-    
-    print("Starting image downloads and processing...")
-    
+def image_jobs(data, folders, index, category, links, on_reused=None):
+    """Yield a pipeline job for every product with a thumbnail that isn't processed yet
+
+    Work goes to the product's canonical files in the index. Every item's
+    category file names are appended to links so they can be linked in once
+    the canonical files exist; on_reused(key) is called for products that
+    need no work.
+    """
+    queued = set()
     for item in data:
         if item['thumb_image']:
+            key = product_key(item)
+            image_url = urljoin('https://www.uncommongoods.com', item['thumb_image'])
             # Generate filenames using sequential ID
             jpg_filename = f"{item['id']}.jpg"
             png_filename = f"no_bg_{item['id']}.png"
-            original_path = os.path.join(folders['original'], jpg_filename)
-            processed_path = os.path.join(folders['processed'], png_filename)
-            
-            # Download image
-            if download_image(item['thumb_image'], original_path):
-                successful_downloads += 1
-                
-                # Remove background
-                if remove_background(original_path, processed_path):
-                    successful_bg_removals += 1
-                else:
-                    failed_bg_removals += 1
-                
-                print(f"\rProcessed ({successful_downloads}/{total_images}) Images - "
-                      f"Downloads: {successful_downloads}, "
-                      f"Background Removals: {successful_bg_removals}", end='', flush=True)
-            else:
-                failed_downloads += 1
-            
-            time.sleep(0.1)
+            links.append((key, os.path.join(folders['original'], jpg_filename),
+                          os.path.join(folders['processed'], png_filename)))
+
+            # Products seen before, here or in another category, cost nothing
+            if index.add(key, item, image_url, category):
+                if on_reused:
+                    on_reused(key)
+                continue
+            if key in queued:
+                continue
+            queued.add(key)
+            yield {
+                'key': key,
+                'url': image_url,
+                'image_path': index.image_path(key),
+                'processed_path': index.processed_path(key)
+            }
+
+def process_data_and_images(data, folders, remover, index, category, on_stage=None, on_reused=None):
+    """Process all data and images
+
+    data may be a generator; each item's image is queued as soon as it is produced.
+    """
+    links = []
+    jobs = image_jobs(data, folders, index, category, links, on_reused)
+
+    def record_stage(job, stage, ok):
+        if stage == 'bg_removed' and ok:
+            index.mark_processed(job['key'], job['url'])
+        if on_stage:
+            on_stage(job, stage, ok)
+    
+    print("Starting image downloads and processing...")
+    
+    # Downloads, conversions and background removals run concurrently
+    # Conversion and PNG optimization run in a process pool alongside the network stages
+    convert = to_png if CONVERT_TO_PNG else None
+    counts = run_image_pipeline(jobs, download_image, convert, lambda images: remove_backgrounds(remover, images),
+                                post_process=optimize_png, on_stage=record_stage,
+                                bg_batch_size=remover.batch_size, bg_host=remover.host,
+                                bg_concurrency=remover.concurrency)
+    
+    # Category folders share the canonical files instead of holding copies
+    for key, image_dest, processed_dest in links:
+        index.link(key, image_dest, processed_dest)
     
     print("\n")
-    return successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals
+    return counts
 
 def main():
+    parser = argparse.ArgumentParser(description="Scrape uncommongoods categories and remove image backgrounds")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip work finished by a previous run and only retry failed or missing items")
+    parser.add_argument('--incremental', action='store_true',
+                        help="save the products added, changed or removed since the last run to a delta CSV")
+    parser.add_argument('--bg-remover', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help="background removal backend (default: %(default)s)")
+    args = parser.parse_args()
+
+    try:
+        remover = get_remover(args.bg_remover)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return
+
     # Define the categories and their URLs
     categories = {
         "girlfriend": "https://www.uncommongoods.com/br/search/?account_id=5343&auth_key=&domain_key=uncommongoods&request_type=search&br_origin=searchBox&query.precision=text_match_precision&facet.precision=standard&query.relaxation=product_type&query.spellcorrect=term_frequency&search_type=keyword&fl=pid%2Ctitle%2Cthumb_image%2Cthumb_image_alt%2Curl%2Creviews%2Creviews_count%2Cprice_range%2Cbr_min_sale_price%2Cbr_max_sale_price%2Cdays_live%2Cmin_inventory%2Cis_customizable%2Cnum_skus%2Cis_coming_soon%2Cvideo_link%2Cmin_age%2Cmax_age%2Cis_ship_delay%2Cavailability_attr%2Cavailable_inventory%2Cshow_only_on_sale_page%2Cships_within%2Carrives_by_holiday%2Cis_experience%2Cmin_price_sku%2Cmax_price_sku%2Citem_type_id%2Cexperience_dates%2Cavailable_ship_methods%2Csubscription_min_shipments%2Csubscription_min_interval%2Cnew%2Csku_desc1%2Csku_desc2%2Csku_main_image&efq=-show_only_on_sale_page:%222%22&facet.field=ug_cat_internal&facet.field=recipients&facet.field=item_type_id&q=girlfriend%20gifts&rows=120&start=0&custom_country=US%26custom_country%3D%22US&_br_uid_2=uid=7621295855054:v=16.0:ts=1737049094254:hc=68:cdp_segments=NjYyN2QyYjY4MzYyYmViNTUwMmZjYjRiOjY2MjdkMmI2ODM2MmJlYjU1MDJmY2IxNyw2NjY4OGE5Y2ZlNjEyMzQ0NTYzNDY5MWI6NjY2ODhhOWNmZTYxMjM0NDU2MzQ2OGZk&request_id=2025-2-101600&url=%22%2Fsearch%3Fq%3Dgirlfriend%2520gifts&ref_url=%22%2Fsearch%22",
@@ -182,7 +217,20 @@ def main():
     base_output_dir = "uncommon_goods_data"
     os.makedirs(base_output_dir, exist_ok=True)
 
+    # Every item's progress is checkpointed so a crashed run can be resumed
+    journal = JobJournal(os.path.join(base_output_dir, 'scrape_journal.db'))
+    if not args.resume:
+        journal.reset()
+
+    # Products repeated across categories are downloaded and processed once.
+    # The index is shared with scraper.py, so its categories count too
+    index = ProductIndex()
+
     for category, url in categories.items():
+        if journal.is_category_done(category):
+            print(f"\nSkipping category {category}: finished in an earlier run")
+            continue
+
         print(f"\nProcessing category: {category}")
         
         # Create category-specific directory
@@ -200,19 +248,57 @@ def main():
             os.makedirs(folder, exist_ok=True)
 
         try:
-            # Fetch and process data
-            raw_data = fetch_and_parse_data(url)
-            if raw_data:
-                products = extract_relevant_data(raw_data)
-                
-                # Save to CSV
-                csv_path = os.path.join(folders['main'], f"{category}_products.csv")
-                save_to_csv(products, csv_path)
-                
-                # Process images - passing the folders dictionary
-                successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals = process_data_and_images(
-                    products, folders
-                )
+            # Only items that haven't been through the whole pipeline need work
+            finished = journal.finished_items(category)
+            csv_path = os.path.join(folders['main'], f"{category}_products.csv")
+            # The URLs above are copied from the site; only the fields we keep are requested
+            search = search_url(url, SEARCH_FIELDS)
+            pages = iter_pages(lambda start: page_url(search, start), fetch_and_parse_data)
+            totals = {'fetched': 0, 'skipped': 0, 'complete': False}
+            detector = ChangeDetector(folders['main'], f"{category}_products") if args.incremental else None
+
+            def pending_products():
+                """Save and checkpoint each page as it arrives, passing on items with work left"""
+                try:
+                    for products in stream_to_csv(pages, csv_path, category):
+                        journal.mark_fetched(category, [product_key(product) for product in products])
+                        totals['fetched'] += len(products)
+                        for product in products:
+                            key = product_key(product)
+                            if detector:
+                                detector.check(key, {
+                                    'title': product['title'], 'price': product['price'], 'image_url': product['thumb_image']
+                                })
+                            if key in finished:
+                                totals['skipped'] += 1
+                            else:
+                                yield product
+                except IncompleteListingError as e:
+                    # The items that did arrive are still processed; the category is retried next run
+                    print(f"\nListing for {category} is incomplete: {e}")
+                    return
+                totals['complete'] = True
+
+            def record_stage(job, stage, ok):
+                if ok:
+                    journal.mark(category, job['key'], stage)
+                else:
+                    journal.mark_failed(category, job['key'], stage)
+
+            # Images are processed while later pages are still being fetched
+            successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals = process_data_and_images(
+                pending_products(), folders, remover, index, category, on_stage=record_stage,
+                on_reused=lambda key: journal.mark(category, key, BG_REMOVED)
+            )
+
+            if totals['fetched']:
+                print(f"Fetched {totals['fetched']} products")
+                if totals['skipped']:
+                    print(f"Skipped {totals['skipped']} items finished in an earlier run")
+
+                # A listing that broke off part way has to be fetched again
+                if totals['complete'] and not failed_downloads and not failed_bg_removals:
+                    journal.mark_category_done(category)
 
                 # Log results
                 print(f"\nResults for {category}:")
@@ -221,9 +307,24 @@ def main():
                 print(f"Successfully removed backgrounds: {successful_bg_removals} images")
                 print(f"Failed background removals: {failed_bg_removals} images")
 
+            # Products missing from a partial listing aren't reported as removed
+            if detector and totals['fetched']:
+                delta_path = detector.finish(complete=totals['complete'])
+                detector.print_summary()
+                if delta_path:
+                    print(f"Changes saved to {delta_path}")
+
         except Exception as e:
             print(f"Error processing category {category}: {str(e)}")
             continue
 
+    journal.close()
+    index.print_stats()
+    index.close()
+    print_download_stats()
+    bg_cache.get_cache().print_stats()
+    print_transfer_stats()
+    http_client.print_connection_stats()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
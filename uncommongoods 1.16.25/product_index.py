@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+INDEX_PATH = os.getenv('PRODUCT_INDEX_PATH', 'product_index.db')
+# Every product's image and processed PNG are stored once here; category
+# folders get hard links to these files
+STORE_DIR = os.getenv('PRODUCT_STORE_DIR', 'products')
+
+
+def product_key(item):
+    """Stable identity of a product: its pid, or its canonical url when there is none"""
+    return str(item.get('pid') or item['url'])
+
+
+def _file_stem(key):
+    # pids are safe to use as file names; urls are hashed
+    if re.fullmatch(r'[\w-]+', key):
+        return key
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def link_file(src, dst):
+    """Make dst the same file as src without copying, if the filesystem allows"""
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Hard links don't work across devices or on some filesystems
+        shutil.copyfile(src, dst)
+
+
+class ProductIndex:
+    """Products seen under any category, each with one canonical image and PNG
+
+    A product found again in another category (or another run) is linked into
+    that category's folders instead of being downloaded and processed again.
+    """
+
+    def __init__(self, path=INDEX_PATH, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.images_dir = os.path.join(store_dir, 'images')
+        self.processed_dir = os.path.join(store_dir, 'processed')
+        os.makedirs(self.images_dir, exist_ok=True)
+        os.makedirs(self.processed_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                product_key TEXT PRIMARY KEY,
+                url TEXT,
+                title TEXT,
+                image_url TEXT,
+                processed_image_url TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS memberships (
+                product_key TEXT NOT NULL,
+                category TEXT NOT NULL,
+                item_id INTEGER,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (product_key, category)
+            )
+        """)
+        self.reused = 0
+        self.new = 0
+
+    def image_path(self, key):
+        return os.path.join(self.images_dir, f"{_file_stem(key)}.jpg")
+
+    def processed_path(self, key):
+        return os.path.join(self.processed_dir, f"{_file_stem(key)}.png")
+
+    def add(self, key, item, image_url, category):
+        """Record a product and its category; returns True if its processed PNG is already current"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                """INSERT INTO products (product_key, url, title, image_url, updated_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (product_key) DO UPDATE SET url = excluded.url, title = excluded.title,
+                   image_url = excluded.image_url, updated_at = excluded.updated_at""",
+                (key, item.get('url'), item.get('title'), image_url, now)
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO memberships (product_key, category, item_id, updated_at) VALUES (?, ?, ?, ?)",
+                (key, category, item.get('id'), now)
+            )
+            row = self.conn.execute(
+                "SELECT processed_image_url FROM products WHERE product_key = ?", (key,)
+            ).fetchone()
+            self.conn.execute("COMMIT")
+
+        # Reprocess if the product's image changed or the stored file went missing
+        current = row[0] == image_url and os.path.exists(self.processed_path(key))
+        if current:
+            self.reused += 1
+        else:
+            self.new += 1
+        return current
+
+    def mark_processed(self, key, image_url):
+        """Record that the canonical PNG now matches image_url"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE products SET processed_image_url = ?, updated_at = ? WHERE product_key = ?",
+                (image_url, time.time(), key)
+            )
+
+    def link(self, key, image_dest=None, processed_dest=None):
+        """Link a product's canonical files into a category folder; returns False if they don't exist yet"""
+        try:
+            if processed_dest:
+                link_file(self.processed_path(key), processed_dest)
+            if image_dest and os.path.exists(self.image_path(key)):
+                link_file(self.image_path(key), image_dest)
+            return True
+        except OSError:
+            return False
+
+    def categories(self, key):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT category FROM memberships WHERE product_key = ? ORDER BY category", (key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def print_stats(self):
+        print(f"Product index: {self.reused} products reused, {self.new} new or changed")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
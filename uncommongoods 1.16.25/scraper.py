@@ -1,18 +1,34 @@
-import requests
 import csv
+import itertools
 import os
+import sys
 import json
 from urllib.parse import urljoin
-import time
 from pathlib import Path
-import replicate
 from dotenv import load_dotenv
-from PIL import Image
+# Modules shared by every scraper live in scraper_common, next to this folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraper_common import bg_cache, http_client
+from scraper_common.bg_removers import get_remover, remove_backgrounds
+from scraper_common.download_cache import get_download_cache, print_download_stats
+from scraper_common.image_pipeline import run_image_pipeline
+from scraper_common.image_transforms import optimize_png, to_png
+from scraper_common.outputs import ParquetOutput
+from scraper_common.change_detection import ChangeDetector
+from product_index import ProductIndex, product_key
+from bloomreach import PAGE_SIZE, IncompleteListingError, fetch_page, iter_pages, print_transfer_stats, search_url
 
 # Load environment variables
 load_dotenv()
 REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
-os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+if REPLICATE_API_TOKEN:
+    os.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_TOKEN
+BASE_URL = "https://www.uncommongoods.com"
+# The model accepts JPGs directly; set CONVERT_TO_PNG=1 to upload RGBA PNGs instead
+CONVERT_TO_PNG = os.getenv('CONVERT_TO_PNG') == '1'
+# INCREMENTAL=1 saves the products added, changed or removed since the last run to a delta CSV.
+# Images whose URL hasn't changed are never reprocessed either way (see product_index)
+INCREMENTAL = os.getenv('INCREMENTAL') == '1'
 
 def load_categories():
     """Load and display available categories"""
@@ -35,30 +51,37 @@ def prompt_category_selection(categories):
         except ValueError:
             print("Please enter a valid number")
 
-def generate_url(category):
-    """Generate URL for the selected category"""
+def generate_url(category, start=0, rows=PAGE_SIZE):
+    """Generate URL for one page of the selected category"""
     base_url = "https://www.uncommongoods.com/br/search/?"
-    url = "https://www.uncommongoods.com/br/search/?account_id=5343&auth_key=&domain_key=uncommongoods&request_type=search&br_origin=searchBox&search_type=category&fl=pid%2Ctitle%2Cthumb_image%2Cthumb_image_alt%2Curl%2Creviews%2Creviews_count%2Cprice_range%2Cbr_min_sale_price%2Cbr_max_sale_price%2Cdays_live%2Cmin_inventory%2Cis_customizable%2Cnum_skus%2Cis_coming_soon%2Cvideo_link%2Cmin_age%2Cmax_age%2Cis_ship_delay%2Cavailability_attr%2Cavailable_inventory%2Cshow_only_on_sale_page%2Cships_within%2Carrives_by_holiday%2Cis_experience%2Cmin_price_sku%2Cmax_price_sku%2Citem_type_id%2Cexperience_dates%2Cavailable_ship_methods%2Csubscription_min_shipments%2Csubscription_min_interval%2Cnew%2Csku_desc1%2Csku_desc2%2Csku_main_image&efq=-show_only_on_sale_page:%221%22&facet.field=ug_cat_internal&facet.field=recipients&facet.field=item_type_id"
+    url = "https://www.uncommongoods.com/br/search/?account_id=5343&auth_key=&domain_key=uncommongoods&request_type=search&br_origin=searchBox&search_type=category&efq=-show_only_on_sale_page:%221%22"
     
-    # Replace the category in the URL
-    url = url + f"&q={category}&rows=120&start=240&sort=seven_day_sales%20desc&custom_country=US%26custom_country%3D%22US&_br_uid_2=uid=7621295855054:v=16.0:ts=1737049094254:hc=20&request_id=2025-1-161400&url=%22%2F{category}%3Fp%3D3%26s%3Dseven_day_sales%2520desc&ref_url=%22%2F{category}%22"
+    # Replace the category and page in the URL
+    page = start // rows + 1
+    url = search_url(url, SEARCH_FIELDS) + f"&q={category}&rows={rows}&start={start}&sort=seven_day_sales%20desc&custom_country=US%26custom_country%3D%22US&_br_uid_2=uid=7621295855054:v=16.0:ts=1737049094254:hc=20&request_id=2025-1-161400&url=%22%2F{category}%3Fp%3D{page}%26s%3Dseven_day_sales%2520desc&ref_url=%22%2F{category}%22"
     
     return url
 
 def fetch_and_parse_data(url):
-    response = requests.get(url)
+    response = fetch_page(url)
     if response.status_code == 200:
         return response.json()
     else:
         raise Exception(f"Failed to fetch data. HTTP Status Code: {response.status_code}")
 
+# The only Bloomreach fields extract_relevant_data reads; search URLs request just these
+SEARCH_FIELDS = ("pid", "title", "price_range", "thumb_image", "url")
+
 def extract_relevant_data(data):
     items = data.get("response", {}).get("docs", [])
+    start = data.get("response", {}).get("start", 0)
     extracted_data = []
 
-    for idx, item in enumerate(items, 1):  # Start enumeration at 1
+    # Number items by their rank in the full result set so pages can arrive in any order
+    for idx, item in enumerate(items, start + 1):
         extracted_data.append({
             "id": idx,
+            "pid": item.get("pid"),
             "title": item.get("title"),
             "price_min": item.get("price_range", [None, None])[0],
             "thumb_image": item.get("thumb_image"),
@@ -79,118 +102,118 @@ def create_folder_structure(base_folder):
     
     return folders
 
-def save_to_csv(data, filepath):
-    """Save data to CSV file"""
-    with open(filepath, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=["id", "title", "price_min", "thumb_image", "url"])
+def stream_to_csv(pages, filepath, category):
+    """Append each page's items to the CSV (and Parquet) as the page arrives, then yield them"""
+    # Fetch the first page before touching the outputs, so a failed fetch leaves the last CSV intact
+    pages = iter(pages)
+    first_page = next(pages, None)
+    if first_page is None:
+        return
+    parquet_path = os.path.splitext(filepath)[0] + '.parquet'
+    with open(filepath, mode="w", newline="", encoding="utf-8") as file, \
+            ParquetOutput(parquet_path, 'uncommongoods', category) as parquet:
+        writer = csv.DictWriter(file, fieldnames=["id", "pid", "title", "price_min", "thumb_image", "url"])
         writer.writeheader()
-        writer.writerows(data)
+        for page in itertools.chain([first_page], pages):
+            items = extract_relevant_data(page)
+            writer.writerows(items)
+            file.flush()
+            for item in items:
+                parquet.append({
+                    'rank': item['id'],
+                    'product_id': item['pid'],
+                    'title': item['title'],
+                    'price': item['price_min'],
+                    'url': urljoin(BASE_URL, item['url']) if item['url'] else None,
+                    'image_url': urljoin(BASE_URL, item['thumb_image']) if item['thumb_image'] else None
+                })
+            yield from items
 
-def download_image(image_url, save_path, base_url="https://www.uncommongoods.com"):
-    """Download an image from URL and save it to specified path"""
+def download_image(image_url, save_path, base_url=BASE_URL):
+    """Download an image, save it to specified path and return its bytes"""
     try:
         full_url = urljoin(base_url, image_url)
-        response = requests.get(full_url)
-        
-        if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
-            return True
-        return False
+        # Revalidates images saved by an earlier run instead of re-fetching them
+        return get_download_cache(os.path.dirname(save_path)).download_bytes(full_url, save_path)
     except Exception as e:
         print(f"Error downloading image {image_url}: {e}")
-        return False
-
-def convert_to_png(jpg_path, png_path):
-    """Convert JPG image to PNG format"""
-    try:
-        with Image.open(jpg_path) as img:
-            # Convert to RGBA to ensure transparency support
-            img = img.convert('RGBA')
-            img.save(png_path, 'PNG')
-        return True
-    except Exception as e:
-        print(f"\nError converting image to PNG: {e}")
-        return False
-
-def remove_background(image_path, output_path):
-    """Remove background from product image using Replicate API"""
-    try:
-        # Convert jpg to png first
-        temp_png_path = image_path.replace('.jpg', '.png')
-        if not convert_to_png(image_path, temp_png_path):
-            return False
-
-        # Use the PNG file for background removal
-        output = replicate.run(
-            "lucataco/remove-bg:95fcc2a26d3899cd6c2691c900465aaeff466285a65c14638cc5f36f34befaf1",
-            input={"image": open(temp_png_path, "rb")}
-        )
-
-        response = requests.get(output, stream=True)
-        response.raise_for_status()
-        
-        with open(output_path, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-
-        # Clean up temporary PNG file
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
-        
-        return True
-    except Exception as e:
-        print(f"\nError removing background: {e}")
-        # Clean up temporary PNG file in case of error
-        if os.path.exists(temp_png_path):
-            os.remove(temp_png_path)
-        return False
+        return None
 
 def get_filename_from_id(item_id, extension='.jpg'):
     """Generate filename from ID with specified extension"""
     return f"{item_id}{extension}"
 
-def process_data_and_images(data, folders):
-    """Process the data and download images"""
-    successful_downloads = 0
-    successful_bg_removals = 0
-    failed_downloads = 0
-    failed_bg_removals = 0
-    total_images = len(data)
-    
-    print("Starting image downloads and processing...")
-    
+def image_jobs(data, folders, index, category, links):
+    """Yield a pipeline job for every product with a thumbnail that isn't processed yet
+
+    Work goes to the product's canonical files in the index. Every item's
+    category file names are appended to links so they can be linked in once
+    the canonical files exist.
+    """
+    queued = set()
     for item in data:
         if item['thumb_image']:
+            key = product_key(item)
+            image_url = urljoin(BASE_URL, item['thumb_image'])
             jpg_filename = get_filename_from_id(item['id'], '.jpg')
             png_filename = get_filename_from_id(item['id'], '.png')
-            image_path = os.path.join(folders['images'], jpg_filename)
-            processed_path = os.path.join(folders['processed'], f"no_bg_{png_filename}")
-            
-            # Download image
-            if download_image(item['thumb_image'], image_path):
-                successful_downloads += 1
-                
-                # Remove background
-                if remove_background(image_path, processed_path):
-                    successful_bg_removals += 1
-                else:
-                    failed_bg_removals += 1
-                
-                print(f"\rProcessed ({successful_downloads}/{total_images}) Images - "
-                      f"Downloads: {successful_downloads}, "
-                      f"Background Removals: {successful_bg_removals}", end='', flush=True)
-            else:
-                failed_downloads += 1
-            
-            time.sleep(0.1)
+            links.append((key, os.path.join(folders['images'], jpg_filename),
+                          os.path.join(folders['processed'], f"no_bg_{png_filename}")))
+
+            # Products seen before, here or in another category, cost nothing
+            if index.add(key, item, image_url, category) or key in queued:
+                continue
+            queued.add(key)
+            yield {
+                'key': key,
+                'url': image_url,
+                'image_path': index.image_path(key),
+                'processed_path': index.processed_path(key)
+            }
+
+def record_changes(items, detector):
+    """Pass items on untouched, checking each one against the last run's listing"""
+    for item in items:
+        detector.check(product_key(item), {
+            'title': item['title'], 'price': item['price_min'], 'image_url': item['thumb_image']
+        })
+        yield item
+
+def process_data_and_images(data, folders, remover, index, category):
+    """Process the data and download images
+
+    data may be a generator; each item's image is queued as soon as it is produced.
+    """
+    links = []
+    jobs = image_jobs(data, folders, index, category, links)
+
+    def record_stage(job, stage, ok):
+        if stage == 'bg_removed' and ok:
+            index.mark_processed(job['key'], job['url'])
+    
+    print("Starting image downloads and processing...")
+    
+    # Downloads, conversions and background removals run concurrently.
+    # Conversion and PNG optimization run in a process pool alongside the network stages
+    convert = to_png if CONVERT_TO_PNG else None
+    counts = run_image_pipeline(jobs, download_image, convert, lambda images: remove_backgrounds(remover, images),
+                                post_process=optimize_png, on_stage=record_stage,
+                                bg_batch_size=remover.batch_size, bg_host=remover.host,
+                                bg_concurrency=remover.concurrency)
+    
+    # Category folders share the canonical files instead of holding copies
+    for key, image_dest, processed_dest in links:
+        index.link(key, image_dest, processed_dest)
     
     print("\n")
-    return successful_downloads, failed_downloads, successful_bg_removals, failed_bg_removals
+    return counts
 
 if __name__ == "__main__":
-    if not REPLICATE_API_TOKEN:
-        print("Error: REPLICATE_API_TOKEN not found in .env file")
+    # Background removal backend comes from BG_REMOVER: replicate, local or rembg
+    try:
+        remover = get_remover()
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
         exit(1)
 
     # Load and display categories
@@ -198,28 +221,54 @@ if __name__ == "__main__":
     selected_category = prompt_category_selection(categories)
     
     print(f"\nSelected category: {selected_category}")
-    url = generate_url(selected_category)
 
     try:
         # Create folder structure
         folders = create_folder_structure(selected_category)
         
-        # Fetch and process data
-        raw_data = fetch_and_parse_data(url)
-        extracted_data = extract_relevant_data(raw_data)
-        
-        # Save CSV file
+        # Items go to the CSV and the image pipeline page by page as pages arrive,
+        # so images are processed while later pages are still being fetched
         csv_path = os.path.join(folders['main'], 'uncommongoods_products.csv')
-        save_to_csv(extracted_data, csv_path)
-        print(f"Data saved to {csv_path}")
+        pages = iter_pages(lambda start: generate_url(selected_category, start), fetch_and_parse_data)
+        listing = {'complete': False}
+
+        def listed_items():
+            try:
+                yield from stream_to_csv(pages, csv_path, selected_category)
+            except IncompleteListingError as e:
+                # The items that did arrive are still processed
+                print(f"\nListing for {selected_category} is incomplete: {e}")
+                return
+            listing['complete'] = True
+
+        items = listed_items()
+        if INCREMENTAL:
+            detector = ChangeDetector(folders['main'], 'uncommongoods_products')
+            items = record_changes(items, detector)
         
         # Download images and process backgrounds
-        successful_dl, failed_dl, successful_bg, failed_bg = process_data_and_images(extracted_data, folders)
+        index = ProductIndex()
+        successful_dl, failed_dl, successful_bg, failed_bg = process_data_and_images(
+            items, folders, remover, index, selected_category
+        )
+        print(f"Data saved to {csv_path}")
         print(f"\nDownload Summary for {selected_category}:")
         print(f"Successfully downloaded: {successful_dl} images")
         print(f"Failed downloads: {failed_dl} images")
         print(f"Successfully removed backgrounds: {successful_bg} images")
         print(f"Failed background removals: {failed_bg} images")
+        # Products missing from a partial listing aren't reported as removed
+        if INCREMENTAL and detector.current:
+            delta_path = detector.finish(complete=listing['complete'])
+            detector.print_summary()
+            if delta_path:
+                print(f"Changes saved to {delta_path}")
+        index.print_stats()
+        index.close()
+        print_download_stats()
+        bg_cache.get_cache().print_stats()
+        print_transfer_stats()
+        http_client.print_connection_stats()
         
     except Exception as e:
         print(f"An error occurred processing {selected_category}: {e}")
@@ -0,0 +1,125 @@
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import yt_dlp
+
+# Videos downloaded at once, and fragments fetched at once for each video
+WORKERS = int(os.getenv('YT_WORKERS', '4'))
+FRAGMENTS = int(os.getenv('YT_FRAGMENTS', '4'))
+
+# IDs of every video downloaded so far; listed videos found here are skipped
+ARCHIVE = 'download_archive.txt'
+
+
+def read_url_file(path):
+    """Read one URL per line, skipping blank lines and # comments"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def iter_videos(ydl, url):
+    """Yield the entry of every video behind a video, playlist or channel URL
+
+    Playlists and channels are listed without resolving each video, so even
+    a channel of hundreds of Shorts is listed in a few requests.
+    """
+    info = ydl.extract_info(url, download=False, process=False)
+    if info is None:
+        return
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        yield info
+        return
+
+    for entry in info.get('entries') or []:
+        if not entry:
+            continue
+        # A channel's tabs (Videos, Shorts, ...) are playlists of their own
+        if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+            yield from iter_videos(ydl, entry['url'])
+        else:
+            yield entry
+
+
+def download_video(url, options):
+    """Download one video; returns True on success"""
+    # Each download gets its own YoutubeDL, which isn't safe to share between threads
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.download([url]) == 0
+
+
+def batch_download(urls, output_dir='.', workers=WORKERS, fragments=FRAGMENTS, archive=ARCHIVE,
+                   video_format='bestvideo'):
+    """Download every video behind urls that isn't in the archive yet; returns (downloaded, skipped, failed)"""
+    os.makedirs(output_dir, exist_ok=True)
+    options = {
+        'format': video_format,
+        'outtmpl': os.path.join(output_dir, '%(title)s [%(id)s].%(ext)s'),  # IDs keep same-titled Shorts apart
+        'concurrent_fragment_downloads': fragments,
+        'download_archive': archive,
+        'quiet': True,
+        'noprogress': True,  # Progress bars of parallel downloads would overwrite each other
+        'no_warnings': False,
+    }
+
+    # List everything first and drop what the archive already has
+    pending = {}
+    skipped = 0
+    with yt_dlp.YoutubeDL({**options, 'extract_flat': 'in_playlist'}) as ydl:
+        for url in urls:
+            try:
+                for entry in iter_videos(ydl, url):
+                    if ydl.in_download_archive(entry):
+                        skipped += 1
+                    else:
+                        video_url = entry.get('webpage_url') or entry.get('url')
+                        pending.setdefault(entry.get('id') or video_url, video_url)
+            except Exception as e:
+                print(f"An error occurred listing {url}: {str(e)}")
+    print(f"{len(pending)} videos to download, {skipped} already in {archive}")
+
+    downloaded = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_video, url, options): url for url in pending.values()}
+        for future in as_completed(futures):
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"An error occurred downloading {futures[future]}: {str(e)}")
+                ok = False
+            if ok:
+                downloaded += 1
+            else:
+                failed += 1
+            print(f"[{downloaded + failed}/{len(futures)}] {'Downloaded' if ok else 'Failed'} {futures[future]}")
+
+    return downloaded, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download many YouTube videos, playlists or channels at once")
+    parser.add_argument('urls', nargs='*', help="video, playlist or channel URLs")
+    parser.add_argument('--file', metavar='FILE', help="file with one URL per line")
+    parser.add_argument('--output', default='.', help="folder to save videos in (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="videos downloaded at once (default: %(default)s)")
+    parser.add_argument('--fragments', type=int, default=FRAGMENTS,
+                        help="fragments downloaded at once per video (default: %(default)s)")
+    parser.add_argument('--archive', default=ARCHIVE,
+                        help="file recording downloaded video IDs (default: %(default)s)")
+    parser.add_argument('--format', default='bestvideo', help="yt-dlp format (default: %(default)s)")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.file:
+        urls += read_url_file(args.file)
+    if not urls:
+        parser.error("give at least one URL or --file")
+
+    downloaded, skipped, failed = batch_download(urls, args.output, args.workers, args.fragments,
+                                                 args.archive, args.format)
+    print(f"Batch completed: {downloaded} downloaded, {skipped} skipped, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()